@@ -0,0 +1,288 @@
+"""
+This script measures performance of ComputationFunctions and of the delay-and-sum block processing used by the real-time
+script. No audio device is needed, sounddevice stream is replaced by synthetic 8 (or M) channel noise.
+
+Beam pattern functions are timed for several numbers of microphones and resolutions. Block processing is timed for
+several block sizes and sampling frequencies and per-block latency percentiles are reported together with the real-time
+budget of one block (blocksize / samplerate). Results are saved to a JSON file, which can be compared with results of
+another version by --compare to catch regressions.
+
+Beam pattern surfaces and block processors are timed also in float32 (complex64), their max_error is the highest
+difference from the float64 result relative to the highest magnitude of the float64 result.
+
+Before timing, the closed-form (Bessel) response of circular arrays is compared with the direct sum for several
+arrays, frequencies and vertical angles, the script fails if the deviation exceeds BESSEL_TOLERANCE. Block processing
+of recordings (delay_and_sum_blocks) is compared with delay_and_sum of the whole signal in the same way.
+
+Example (from the repository root, which has to be on PYTHONPATH):
+    PYTHONPATH=. python Benchmarks/benchmarks.py --output results.json
+    PYTHONPATH=. python Benchmarks/benchmarks.py --quick --compare results.json
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+
+import ComputationFunctions.ComputationFunctions as cf
+from ComputationFunctions.DelayAndSum import DelayAndSumProcessor
+from ComputationFunctions.FrequencyDomain import StftBeamformer, MvdrBeamformer
+from ComputationFunctions.DirectionOfArrival import SrpScanner
+from ComputationFunctions.MeasurementProcessing import delay_and_sum_blocks
+
+# ------------------------------------------------------------
+# ------------------- VARIABLES DEFINITION -------------------
+# ------------------------------------------------------------
+radius = 0.05  # meters
+theta = 90  # degrees
+phi = 20  # degrees
+c = 343  # meters/second
+frequency = 4000  # Hz
+
+# ----------------------------------------------------------------
+# ------------------------- MEASUREMENTS -------------------------
+# ----------------------------------------------------------------
+
+def measure(function, repeats: int, warmup: int = 1) -> np.ndarray:
+    """
+    Calls function repeatedly and measures duration of every call.
+    :param function: function without arguments
+    :param repeats: number of measured calls
+    :param warmup: number of calls which are not measured
+    :return: durations of the calls in seconds
+    """
+    for _ in range(warmup):
+        function()
+    durations = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations[i] = time.perf_counter() - start
+    return durations
+
+def summary(durations: np.ndarray) -> dict:
+    """ Returns statistics of measured durations in seconds """
+    return {
+        "mean": float(durations.mean()),
+        "p50": float(np.percentile(durations, 50)),
+        "p90": float(np.percentile(durations, 90)),
+        "p99": float(np.percentile(durations, 99)),
+        "max": float(durations.max()),
+        "repeats": int(durations.size),
+    }
+
+def relative_error(result: np.ndarray, reference: np.ndarray) -> float:
+    """ Returns highest difference of a result from the float64 reference relative to the highest reference value """
+    return float(np.abs(result - reference).max() / np.abs(reference).max())
+
+def block_outputs(processor, signal: np.ndarray) -> np.ndarray:
+    """ Processes all blocks of a signal and returns concatenated outputs, power of all directions for SRP scanners """
+    outputs = []
+    for block in signal:
+        output = processor.process(block)
+        outputs.append(np.array(processor.power if isinstance(processor, SrpScanner) else output, dtype=float))
+    return np.concatenate(outputs)
+
+def benchmark_functions(mic_counts: list, resolutions: list, repeats: int) -> dict:
+    """ Times beam pattern, decibel and quantization functions """
+    results = {}
+    for M in mic_counts:
+        for resolution in resolutions:
+            results[f"cma_beampattern/M={M}/resolution={resolution}"] = summary(measure(
+                lambda: cf.cma_beampattern(theta, phi, frequency, M, radius, c, resolution), repeats))
+            results[f"cma_beampattern_quantization/M={M}/resolution={resolution}"] = summary(measure(
+                lambda: cf.cma_beampattern_quantization(theta, phi, frequency, M, radius, c, resolution, 48000),
+                repeats))
+        results[f"cma_tmi/M={M}"] = summary(measure(lambda: cf.cma_tmi(radius, M, phi, theta, c), repeats))
+    for resolution in resolutions:
+        beampattern = cf.cma_beampattern(theta, phi, frequency, 8, radius, c, resolution)
+        magnitudes = np.abs(beampattern)
+        results[f"signal_to_decibels/size={resolution}"] = summary(measure(
+            lambda: cf.signal_to_decibels(magnitudes), repeats))
+        results[f"signal_to_decibels_complex/size={resolution}"] = summary(measure(
+            lambda: cf.signal_to_decibels(beampattern), repeats))
+        latencies = np.random.default_rng(0).uniform(0, 1e-3, resolution)
+        results[f"quantize_tmi/size={resolution}"] = summary(measure(
+            lambda: cf.quantize_tmi(latencies, 48000), repeats))
+    frequencies = np.arange(20, 20000, 100)
+    look_angles = np.linspace(0, 360, max(resolutions))
+    results[f"cma_response/surface={frequencies.size}x{look_angles.size}"] = summary(measure(
+        lambda: cf.cma_response(theta, phi, look_angles, frequencies, 8, radius, c), max(1, repeats // 10)))
+    reference = cf.cma_response(theta, phi, look_angles, frequencies, 8, radius, c)
+    name = f"cma_response_float32/surface={frequencies.size}x{look_angles.size}"
+    results[name] = summary(measure(
+        lambda: cf.cma_response(theta, phi, look_angles, frequencies, 8, radius, c, dtype=np.float32),
+        max(1, repeats // 10)))
+    results[name]["max_error"] = relative_error(
+        cf.cma_response(theta, phi, look_angles, frequencies, 8, radius, c, dtype=np.float32), reference)
+    for method in ("direct", "bessel"):
+        results[f"cma_response_{method}/M=64/surface={frequencies.size}x{look_angles.size}"] = summary(measure(
+            lambda: cf.cma_response(theta, phi, look_angles, frequencies, 64, radius, c, method=method),
+            max(1, repeats // 10)))
+    return results
+
+def benchmark_blocks(mic_counts: list, blocksizes: list, samplerates: list, blocks: int) -> dict:
+    """ Times processing of single blocks by the delay-and-sum processors and compares it with the block duration """
+    results = {}
+    rng = np.random.default_rng(0)
+    for M in mic_counts:
+        for samplerate in samplerates:
+            for blocksize in blocksizes:
+                signal = rng.standard_normal((blocks, blocksize, M))
+                budget = blocksize / samplerate
+                processors = {
+                    "dsb": lambda dtype: DelayAndSumProcessor(
+                        cf.cma_sample_delays(radius, M, phi, theta, c, samplerate), blocksize, dtype=dtype),
+                    "dsb_fractional": lambda dtype: DelayAndSumProcessor(
+                        cf.cma_sample_delays(radius, M, phi, theta, c, samplerate, True), blocksize,
+                        fractional_order=3, dtype=dtype),
+                    "stft": lambda dtype: StftBeamformer(cf.cma_tmi_matrix(radius, M, phi, theta, c), samplerate,
+                                                         dtype=dtype),
+                    "mvdr": lambda dtype: MvdrBeamformer(cf.cma_tmi_matrix(radius, M, phi, theta, c), samplerate,
+                                                         dtype=dtype),
+                    "mvdr_interval8": lambda dtype: MvdrBeamformer(
+                        cf.cma_tmi_matrix(radius, M, phi, theta, c), samplerate, update_interval=8, dtype=dtype),
+                    "srp_phat_360": lambda dtype: SrpScanner(
+                        cf.cma_tmi_matrix(radius, M, np.arange(360), theta, c), np.arange(360), samplerate,
+                        blocksize, dtype=dtype),
+                }
+                for name, create in processors.items():
+                    for dtype in (np.float64, np.float32):
+                        processor = create(dtype)
+                        block_index = iter(range(blocks + 1))
+                        durations = measure(lambda: processor.process(signal[next(block_index) % blocks]), blocks)
+                        result = summary(durations)
+                        result["budget"] = budget
+                        result["p99_budget_ratio"] = result["p99"] / budget
+                        if dtype is np.float32:
+                            name_dtype = f"{name}_float32"
+                            result["max_error"] = relative_error(block_outputs(create(dtype), signal),
+                                                                 block_outputs(create(np.float64), signal))
+                        else:
+                            name_dtype = name
+                        results[f"{name_dtype}/M={M}/samplerate={samplerate}/blocksize={blocksize}"] = result
+    return results
+
+def check_bessel_accuracy(mic_counts: list = (8, 16, 64, 128), radii: list = (0.05, 0.2),
+                          thetas: list = (90, 60, 20)) -> float:
+    """
+    Compares response of method='bessel' with method='direct' for all combinations of the parameters.
+    :param mic_counts: numbers of microphones of the circular arrays
+    :param radii: radii of the circular arrays in meters
+    :param thetas: vertical angles in degrees
+    :return: highest absolute deviation, it is asserted not to exceed cf.BESSEL_TOLERANCE
+    """
+    frequencies = np.array([20, 500, 2000, 8000, 20000])
+    look_angles = np.linspace(0, 360, 181)
+    deviation = 0.0
+    for M in mic_counts:
+        for radius_m in radii:
+            for theta_deg in thetas:
+                direct = cf.cma_response(theta_deg, [0, 37], look_angles, frequencies, M, radius_m, c, method="direct")
+                bessel = cf.cma_response(theta_deg, [0, 37], look_angles, frequencies, M, radius_m, c, method="bessel")
+                deviation = max(deviation, float(np.abs(bessel - direct).max()))
+    assert deviation <= cf.BESSEL_TOLERANCE, f"Bessel response deviates by {deviation:.1e} from the direct sum"
+    return deviation
+
+def check_block_processing(mic_counts: list = (8, 64), blocksizes: list = (256, 4800),
+                           fractional_orders: list = (None, 3), tolerance: float = 1e-12) -> float:
+    """
+    Compares delay_and_sum_blocks with the reference cf.delay_and_sum of the whole signal, for integer and fractional
+    delays. The signal does not end at a block boundary, so the last partial block and the tail are compared too.
+    :param mic_counts: numbers of microphones of the circular arrays
+    :param blocksizes: numbers of frames in one block
+    :param fractional_orders: orders of Lagrange fractional delay filters, None for integer delays
+    :param tolerance: maximal absolute deviation of the outputs
+    :return: highest absolute deviation, it is asserted not to exceed tolerance
+    """
+    rng = np.random.default_rng(0)
+    deviation = 0.0
+    for M in mic_counts:
+        for fractional_order in fractional_orders:
+            sample_delays = cf.cma_sample_delays(radius, M, phi, theta, c, 48000, fractional_order is not None)
+            for blocksize in blocksizes:
+                signal = rng.standard_normal((3 * blocksize + blocksize // 3, M))
+                reference = cf.delay_and_sum(signal, sample_delays, fractional_order)
+                blocks = (signal[start:start + blocksize] for start in range(0, len(signal), blocksize))
+                output = np.concatenate(list(delay_and_sum_blocks(blocks, sample_delays, blocksize,
+                                                                  fractional_order=fractional_order)))
+                assert output.shape == reference.shape, f"Block output has {output.size} samples, not {reference.size}"
+                deviation = max(deviation, float(np.abs(output - reference).max()))
+    assert deviation <= tolerance, f"Block processing deviates by {deviation:.1e} from delay_and_sum"
+    return deviation
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares median durations with results of another version.
+    :param results: benchmarks of this run
+    :param baseline: benchmarks loaded from a JSON file
+    :param tolerance: allowed relative slowdown, e.g. 0.2 for 20 %
+    :return: list of names of benchmarks which are slower than allowed
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["p50"] / baseline[name]["p50"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  <-- REGRESSION"
+        print(f"{name}: {ratio:.2f}x{flag}")
+    return regressions
+
+def main():
+    """ Parses the command line, runs all benchmarks and saves and compares the results """
+    parser = argparse.ArgumentParser(description="Benchmarks of ComputationFunctions and DSB block processing.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are saved to")
+    parser.add_argument("--compare", help="JSON file with results of another version")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown for --compare")
+    parser.add_argument("--quick", action="store_true", help="smaller grid and fewer repeats")
+    arguments = parser.parse_args()
+
+    if arguments.quick:
+        mic_counts, resolutions, repeats = [8], [360], 5
+        blocksizes, samplerates, blocks = [256, 4800], [48000], 50
+    else:
+        mic_counts, resolutions, repeats = [8, 16, 32], [360, 3600], 20
+        blocksizes, samplerates, blocks = [64, 128, 256, 4800], [44100, 48000, 96000], 500
+
+    bessel_deviation = check_bessel_accuracy()
+    print(f"Bessel response deviation from the direct sum: {bessel_deviation:.1e} "
+          f"(tolerance {cf.BESSEL_TOLERANCE:.0e})")
+    block_deviation = check_block_processing()
+    print(f"Block processing deviation from delay_and_sum: {block_deviation:.1e}")
+
+    benchmarks = {}
+    benchmarks.update(benchmark_functions(mic_counts, resolutions, repeats))
+    benchmarks.update(benchmark_blocks(mic_counts, blocksizes, samplerates, blocks))
+
+    for name, result in benchmarks.items():
+        line = f"{name}: p50 {result['p50'] * 1e3:.3f} ms, p99 {result['p99'] * 1e3:.3f} ms"
+        if "budget" in result:
+            line += f" ({100 * result['p99_budget_ratio']:.1f} % of {result['budget'] * 1e3:.2f} ms budget)"
+        if "max_error" in result:
+            line += f", max error {result['max_error']:.1e}"
+        print(line)
+
+    with open(arguments.output, "w") as output_file:
+        json.dump({
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "bessel_deviation": bessel_deviation,
+            "block_deviation": block_deviation,
+            "benchmarks": benchmarks,
+        }, output_file, indent=2)
+    print(f"Results saved to {arguments.output}")
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            regressions = compare(benchmarks, json.load(baseline_file)["benchmarks"], arguments.tolerance)
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmarks are slower than {arguments.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import ComputationFunctions.ComputationFunctions as cf
 import numpy as np
-import matplotlib.pyplot as plt
 
 # --------------- VARIABLES DECLARATIONS ---------------
 frequency = 2000
@@ -11,17 +10,24 @@ M = 8
 radius = 0.05
 resolution = 1000
 
-# --------------- BEAMPATTERN CALCULATION ---------------
+def main():
+    """ Calculates beam pattern of the circular microphone array and shows it in a polar plot """
+    import matplotlib.pyplot as plt
 
-beampattern = cf.cma_beampattern(theta, phi, frequency, M, radius, c, resolution)
-amplitudes = cf.signal_to_decibels([np.abs(x) for x in beampattern])
+    # --------------- BEAMPATTERN CALCULATION ---------------
 
-# --------------- DISPLAY PLOT ---------------
+    beampattern = cf.cma_beampattern(theta, phi, frequency, M, radius, c, resolution)
+    amplitudes = cf.signal_to_decibels(beampattern)
 
-fig, axes = plt.subplots(subplot_kw={'projection': 'polar'}, figsize=(3, 3), dpi=200)
-reference_radians_values = np.linspace(0, 2 * np.pi, resolution)
-axes.plot(reference_radians_values, amplitudes)
-axes.set_ylim([-40, 0])
-axes.set_yticks([-40, -30, -20, -10, 0])
+    # --------------- DISPLAY PLOT ---------------
 
-plt.show()
\ No newline at end of file
+    fig, axes = plt.subplots(subplot_kw={'projection': 'polar'}, figsize=(3, 3), dpi=200)
+    reference_radians_values = np.linspace(0, 2 * np.pi, resolution)
+    axes.plot(reference_radians_values, amplitudes)
+    axes.set_ylim([-40, 0])
+    axes.set_yticks([-40, -30, -20, -10, 0])
+
+    plt.show()
+
+if __name__ == "__main__":
+    main()
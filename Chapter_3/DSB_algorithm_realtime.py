@@ -2,35 +2,54 @@
 This script is calculating delays on the 8 microphone channels in real time.
 
 First off, it prints input/output audio devices with their id. At the start please see which id is
-currently holding the microphone array input and set it in variable sd.default.device. Second number is 
+currently holding the microphone array input and set it in variable device. Second number is 
 ID of an output device (e.g. your computer speakers).IDs usually differes every time you turn on the
 computer or plug in or remove any audio devices.
 
 Duration of the programm can be specified in seconds in variable duration. Output signal is saved in
-output_data folder.
+output_data folder while the program is running. For long captures set max_file_duration, the recording is
+then split into numbered files.
+
+Processing time of every block and xruns reported by sounddevice are monitored, summary is printed every
+report_interval seconds and at the end of the program.
+
+With doa_scan set to True the direction of arrival is estimated in every block by SRP-PHAT over all azimuths. The
+current peak direction is printed every report_interval seconds and power maps of all blocks are saved to output_data.
+With auto_steer the DSB beam follows the peak direction. The scan allocates FFT buffers in every block, so it is
+disabled by default to keep the callback free of allocations.
+
+Steering can be changed while the stream is running by typing commands to the console: "phi <degrees>" steers the
+beam to the nearest preset direction, "gain <value>" changes the gain and "channels <8 input channels>" changes the
+channel map. Changes take effect at the next block and the output is crossfaded, so no clicks are heard.
+
+Without the audio device the same callback can be driven by a recording, e.g. from the repository root
+    PYTHONPATH=. python Chapter_3/DSB_algorithm_realtime.py --replay krok_010.wav --fast --geometry array_geometry.json
+        --compare krok_010_processed.wav
+replays the recording as fast as possible (or paced to real time without --fast), prints throughput and processing
+time of the blocks and compares the DSB output with a file processed offline by Measurements_processing.py.
 """
 import sys
 import os
-import sounddevice as sd
+import argparse
+import threading
 import numpy as np
-from scipy.io.wavfile import write 
-
-# Import of ComputationFunctions from different directory
-current_dir = os.path.dirname(__file__)
-computation_functions_path = os.path.join(current_dir, '..', 'ComputationFunctions')
-computation_functions_path = os.path.abspath(computation_functions_path)
-sys.path.append(computation_functions_path)
-import ComputationFunctions as cf
 
-print(sd.query_devices())
-duration = 3  # determines how long a program should run in seconds
-sd.default.device = 3, 4  # Selection of input and output devices (usually different for every computer)
+import ComputationFunctions.ComputationFunctions as cf
+from ComputationFunctions.DelayAndSum import DelayAndSumProcessor
+from ComputationFunctions.StreamRecorder import StreamRecorder
+from ComputationFunctions.Instrumentation import CallbackMonitor
+from ComputationFunctions.DirectionOfArrival import SrpScanner
+from ComputationFunctions.AudioBackends import open_stream
 
 # ------------------------------------------------------------
 # ------------------- VARIABLES DEFINITION -------------------
 # ------------------------------------------------------------
-radius = 0.05  # radius of a circular microphone array in meters
-M = 8  # number of microphones in circular microphone array
+duration = 3  # determines how long a program should run in seconds
+device = 3, 4  # Selection of input and output devices (usually different for every computer)
+
+# Positions of microphones and their order in the input channels are loaded from array_geometry.json
+current_dir = os.path.dirname(os.path.abspath(__file__))
+geometry_config = os.path.join(current_dir, 'array_geometry.json')
 theta = 90
 phi = 0
 c = 343  # speed of sound in meters/seconds
@@ -38,91 +57,151 @@ sampling_frequency = 48000  # sampling frequency of microphones in Hz
 
 buffer_size = 4800
 channels_in = 8
-history = None
-previous_buffer = np.zeros((buffer_size, channels_in))
-recording_normal = np.empty((0, channels_in))
-recording_dsb = np.empty((0, 1))
-round_delays_to_decimal_spaces = 2
-delays = cf.cma_tmi(radius, M, phi, theta, c)
-sample_delays = cf.quantize_tmi_to_samples(delays, sampling_frequency)
+gain = 1  # If the signal is too low it can be amplified by raising value of this variable
+fractional_order = None  # order of Lagrange fractional delay filters (e.g. 3), None for delays in whole samples
+
+doa_scan = False  # estimate direction of arrival in every block
+auto_steer = False  # steer the DSB beam to the estimated direction of arrival
+azimuths = np.arange(0, 360, 1)  # scanned horizontal angles in degrees
+preset_step = 5  # degrees between two preset directions
+preset_azimuths = np.arange(0, 360, preset_step)
+
+output_folder = os.path.join(current_dir, 'output_data')
+max_file_duration = None  # maximal length of one output file in seconds, None for a single file
+report_interval = 1  # seconds between printed summaries of the callback processing time
 
 # ----------------------------------------------------------------
 # ------------------------- CALCULATIONS -------------------------
 # ----------------------------------------------------------------
 
-def delay_signal_by_frames(delays: list, input_buffer: np.array, delay_buffer: np.array) -> np.array:
-    """
-    This function takes in previous buffer and uses it to delay data in the current "input_buffer" buffer. It re
-    Signal cannot be delayed by more samples than the size of the buffer.
-    :param delays: list of delays, where index of an array matches channel number
-    :param input_buffer: current buffer
-    :param delay_buffer: previous buffer
-    :return:
-    """
-    if delays == 0:
-        return input_buffer
-    history = delay_buffer[-delays:]
-    delayed_signal = np.concatenate((history, input_buffer))
-    delayed_signal = delayed_signal[:-delays]
-    return delayed_signal
-
-def callback(indata, outdata, frames, time, status):
+def nearest_preset(azimuth: float) -> int:
+    """ Returns preset direction nearest to a horizontal angle in degrees """
+    return preset_azimuths[int(round(azimuth / preset_step)) % preset_azimuths.size]
+
+def steering_console(processor: DelayAndSumProcessor):
     """
-    This function delays signal in real time by using global variable delay_buffer to remember signals from the previous
-    buffer. Both delayed and not delayed signal is then stored in global variables "recording_normal" and "recording_delayed"
-    and then stored in wav files to the output_data folder.
-
-    Delayed signal is stored in outdata and then played by sounddevice library in the device's speakers (delayed
-    signal is converted to stereo for 2 user's device speakers).
-    :param indata: Input data
-    :param outdata: Output data
-    :param frames:
-    :param time:
-    :param status:
+    Reads steering commands from the console while the stream is running. Steering is prepared in this thread and
+    only swapped by the callback.
+    :param processor: processor of the running stream
     """
-    # If the signal is too low it can be amplified by raising value of this variable
-    gain = 1
-    # Rearanging microphones in the correct order
-    indata = indata[:, (4, 0, 5, 1, 6, 2, 7, 3)]
-    # Delaying signal
-    global previous_buffer
-    delayed_ch1 = delay_signal_by_frames(sample_delays[0], indata[:, 0], previous_buffer[:, 0])
-    delayed_ch2 = delay_signal_by_frames(sample_delays[1], indata[:, 1], previous_buffer[:, 1])
-    delayed_ch3 = delay_signal_by_frames(sample_delays[2], indata[:, 2], previous_buffer[:, 2])
-    delayed_ch4 = delay_signal_by_frames(sample_delays[3], indata[:, 3], previous_buffer[:, 3])
-    delayed_ch5 = delay_signal_by_frames(sample_delays[4], indata[:, 4], previous_buffer[:, 4])
-    delayed_ch6 = delay_signal_by_frames(sample_delays[5], indata[:, 5], previous_buffer[:, 5])
-    delayed_ch7 = delay_signal_by_frames(sample_delays[6], indata[:, 6], previous_buffer[:, 6])
-    delayed_ch8 = delay_signal_by_frames(sample_delays[7], indata[:, 7], previous_buffer[:, 7])
-    added_signals = np.empty((4800, 1))
-    global M
-    for i in range(0, len(delayed_ch1)):
-        added_signals[i] = (delayed_ch1[i] + 
-                            delayed_ch2[i] + 
-                            delayed_ch3[i] + 
-                            delayed_ch4[i] + 
-                            delayed_ch5[i] + 
-                            delayed_ch6[i] + 
-                            delayed_ch7[i] + 
-                            delayed_ch8[i]) / M
-        added_signals[i] *= gain
-    # Saving data into delay buffer for next time
-    previous_buffer = indata.copy()
-
-    # output stream
-    outdata[:, 0] = added_signals[:, 0]
-    outdata[:, 1] = added_signals[:, 0]
-
-    # Recording both added and not modified signal together for later analysis
-    global recording_normal
-    global recording_dsb
-    recording_normal = np.concatenate((recording_normal, indata))
-    recording_dsb = np.concatenate((recording_dsb, added_signals))
-
-with sd.Stream(samplerate=sampling_frequency, channels=[8, 2], callback=callback, blocksize=buffer_size):
-    sd.sleep(int(duration * 1000))
-    # Saving recorded data in wav files
-    write("zpracovani-signalu-z-mikrofonnich-poli-s-digitalnimi-mems-mikrofony/Chapter_3/output_data/output_dsb.wav", sampling_frequency, recording_normal)
-    write("zpracovani-signalu-z-mikrofonnich-poli-s-digitalnimi-mems-mikrofony/Chapter_3/output_data/output_8ch_not_processed.wav", sampling_frequency, recording_dsb)
+    for line in sys.stdin:
+        command, *values = line.split() or [""]
+        try:
+            if command == "phi":
+                processor.select(nearest_preset(float(values[0])))
+            elif command == "gain":
+                processor.steer(gain=float(values[0]))
+            elif command == "channels":
+                processor.steer(channel_order=[int(value) for value in values])
+            elif command:
+                print('Unknown command, use "phi <degrees>", "gain <value>" or "channels <input channels>"')
+        except (ValueError, IndexError) as error:
+            print(f"Steering not changed: {error}")
+
+def main():
+    """ Parses the command line, prepares the processing and runs the stream of the audio device or of a recording """
+    parser = argparse.ArgumentParser(description="Real-time delay-and-sum beamforming of the microphone array.")
+    parser.add_argument("--replay", help="recording replayed instead of the audio device")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible instead of real time")
+    parser.add_argument("--geometry", default=geometry_config, help="JSON file with the array geometry")
+    parser.add_argument("--compare", help="file processed offline the DSB output is compared with")
+    parser.add_argument("--dtype", choices=["float32", "float64"], default="float32",
+                        help="data type of the processing, the audio device delivers float32 samples")
+    arguments = parser.parse_args()
+    import soundfile as sf
+    run_duration = duration
+    if arguments.replay is None:
+        import sounddevice as sd
+        print(sd.query_devices())
+    else:
+        # Whole recording is replayed
+        run_duration = sf.info(arguments.replay).duration
+
+    geometry = cf.ArrayGeometry.from_config(arguments.geometry)
+    dtype = np.dtype(arguments.dtype)  # data type of all buffers of the callback
+    scanner = SrpScanner.from_geometry(geometry, azimuths, theta, c, sampling_frequency, buffer_size, channels_in,
+                                       dtype=dtype)
+    # Steering of preset directions is prepared once, switching to a preset in the callback costs no computation
+    preset_delays = cf.array_sample_delays(geometry, preset_azimuths, theta, c, sampling_frequency,
+                                           fractional_order is not None)
+    processor = DelayAndSumProcessor.from_geometry(geometry, phi, theta, c, sampling_frequency, buffer_size,
+                                                   channels_in, gain, fractional_order, max_delay=preset_delays.max(),
+                                                   dtype=dtype)
+    for preset_azimuth, delays in zip(preset_azimuths, preset_delays):
+        processor.add_preset(preset_azimuth, delays)
+
+    # Not processed signal is recorded in the channel order of the input device
+    # Replay as fast as possible is faster than the recorders, so they wait instead of dropping blocks
+    lossless = arguments.replay is not None and arguments.fast
+    recorder_normal = StreamRecorder(os.path.join(output_folder, 'output_8ch_not_processed.wav'), sampling_frequency,
+                                     channels_in, buffer_size, max_file_duration=max_file_duration,
+                                     lossless=lossless, dtype=dtype)
+    recorder_dsb = StreamRecorder(os.path.join(output_folder, 'output_dsb.wav'), sampling_frequency, 1, buffer_size,
+                                  max_file_duration=max_file_duration, lossless=lossless, dtype=dtype)
+    monitor = CallbackMonitor(buffer_size, sampling_frequency)
+    # Power map of every block, rows are blocks and columns directions of azimuths
+    power_maps = np.zeros((int(run_duration * sampling_frequency / buffer_size) + 2, azimuths.size), dtype=dtype)
+    power_map_count = 0
+    steered_direction = None
+
+    def callback(indata, outdata, frames, time, status):
+        """
+        This function delays signal in real time by using DelayAndSumProcessor, whose buffer remembers signals from
+        the previous buffers. Both delayed and not delayed signal is then handed over to recorders "recorder_normal"
+        and "recorder_dsb", which write them to wav files in the output_data folder from a background thread.
+
+        Delayed signal is stored in outdata and then played by sounddevice library in the device's speakers (delayed
+        signal is written to both channels of user's device speakers).
+        :param indata: Input data
+        :param outdata: Output data
+        :param frames:
+        :param time:
+        :param status:
+        """
+        nonlocal steered_direction, power_map_count
+        if doa_scan:
+            scanner.process(indata)
+            if power_map_count < power_maps.shape[0]:
+                power_maps[power_map_count] = scanner.power
+                power_map_count += 1
+            if auto_steer:
+                preset = nearest_preset(scanner.azimuths[scanner.peak])
+                if preset != steered_direction:
+                    processor.select(preset)
+                    steered_direction = preset
+
+        added_signals = processor.process(indata, outdata)
+
+        # Recording both added and not modified signal together for later analysis
+        recorder_normal.write(indata)
+        recorder_dsb.write(added_signals)
+
+    with recorder_normal, recorder_dsb:
+        threading.Thread(target=steering_console, args=(processor,), name="SteeringConsole", daemon=True).start()
+        monitor.start_reporter(report_interval)
+        with open_stream(sampling_frequency, [channels_in, 2], buffer_size, monitor.wrap(callback), device,
+                         arguments.replay, not arguments.fast) as stream:
+            remaining = run_duration
+            while remaining > 0 and not stream.finished.is_set():
+                stream.wait(min(report_interval, remaining))
+                remaining -= report_interval
+                if doa_scan:
+                    print(f"Direction of arrival: {scanner.azimuths[scanner.peak]:.0f} degrees")
+        monitor.stop_reporter()
+    print(monitor.report())
+    if arguments.replay is not None:
+        print(f"Replayed {stream.blocks} blocks {stream.throughput():.1f}x faster than real time")
+    if doa_scan:
+        np.save(os.path.join(output_folder, 'power_maps.npy'), power_maps[:power_map_count])
+    print(f"Dropped blocks: {recorder_normal.dropped_blocks} not processed, {recorder_dsb.dropped_blocks} DSB")
+    if arguments.compare:
+        # Replayed output has the length of whole blocks, offline output contains also the tail after the recording
+        realtime_output, _ = sf.read(os.path.join(output_folder, 'output_dsb.wav'))
+        offline_output, _ = sf.read(arguments.compare)
+        frames = min(realtime_output.shape[0], offline_output.shape[0])
+        difference = np.abs(realtime_output[:frames] - offline_output[:frames]).max()
+        print(f"Maximal difference from {arguments.compare} in {frames} frames: {difference}")
     print("Finished")
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import ComputationFunctions.ComputationFunctions as cf
+import ComputationFunctions.FrequencyDomain as fd
 import numpy as np
-import matplotlib.pyplot as plt
 
 # --------------- VARIABLES DECLARATIONS ---------------
 frequencies = [2000, 4000, 6000]  # Frequencies used to calculate 3 graphs at the time
@@ -9,30 +9,46 @@ theta = 90
 M = 8
 radius = 0.05
 resolution = 2000
+superdirective = False  # compare with superdirective (MVDR for diffuse noise) beamformer of the same array
+loading = 1e-2  # diagonal loading of the superdirective beamformer
 
-# --------------- BEAMPATTERN CALCULATION ---------------
-beampatterns = []
+def main():
+    """ Calculates beam patterns at all frequencies and shows them in polar plots """
+    import matplotlib.pyplot as plt
 
-for freq in frequencies:
-    beampattern_normal = cf.cma_beampattern(theta, 0, freq, M, radius, c, resolution)
-    amplitudes_normal = cf.signal_to_decibels([np.abs(x) for x in beampattern_normal])
+    # --------------- BEAMPATTERN CALCULATION ---------------
+    beampatterns = []
 
-    beampattern_30 = cf.cma_beampattern(theta, 30, freq, M, radius, c, resolution)
-    amplitudes_30 = cf.signal_to_decibels([np.abs(x) for x in beampattern_30])
+    for freq in frequencies:
+        beampattern_normal = cf.cma_beampattern(theta, 0, freq, M, radius, c, resolution)
+        amplitudes_normal = cf.signal_to_decibels(beampattern_normal)
 
-    beampatterns.append((amplitudes_normal, amplitudes_30))
+        beampattern_30 = cf.cma_beampattern(theta, 30, freq, M, radius, c, resolution)
+        amplitudes_30 = cf.signal_to_decibels(beampattern_30)
 
-# --------------- DISPLAYING PLOTS ---------------
+        beampatterns.append((amplitudes_normal, amplitudes_30))
 
-fig, axes = plt.subplots(ncols=3, subplot_kw={'projection': 'polar'}, figsize=(10.3, 3), dpi=200)
-reference_radians_values = np.linspace(0, 2 * np.pi, resolution)
-for cols in range(0, 3):
-    #axes[cols].plot(reference_radians_values, beampatterns[cols][1], color='#96BAFF', linewidth='1.2')
-    axes[cols].plot(reference_radians_values, beampatterns[cols][0], color='green', linewidth='1.2')
-    axes[cols].set_ylim([-40, 0])
-    axes[cols].set_title(f"{frequencies[cols]} Hz", va='bottom')
-    box = axes[cols].get_position()
-    axes[cols].set_position([box.x0, box.y0, box.width * 0.9, box.height * 0.9])
-    axes[cols].set_yticks([-40, -30, -20, -10, 0])
+    if superdirective:
+        superdirective_response = fd.superdirective_response(cf.cma_geometry(radius, M), theta, 0,
+                                                             np.linspace(0, 360, resolution), frequencies, c, loading)
+        amplitudes_superdirective = cf.signal_to_decibels(superdirective_response[:, 0])
 
-plt.show()
\ No newline at end of file
+    # --------------- DISPLAYING PLOTS ---------------
+
+    fig, axes = plt.subplots(ncols=3, subplot_kw={'projection': 'polar'}, figsize=(10.3, 3), dpi=200)
+    reference_radians_values = np.linspace(0, 2 * np.pi, resolution)
+    for cols in range(0, 3):
+        #axes[cols].plot(reference_radians_values, beampatterns[cols][1], color='#96BAFF', linewidth='1.2')
+        axes[cols].plot(reference_radians_values, beampatterns[cols][0], color='green', linewidth='1.2')
+        if superdirective:
+            axes[cols].plot(reference_radians_values, amplitudes_superdirective[cols], color='#96BAFF', linewidth='1.2')
+        axes[cols].set_ylim([-40, 0])
+        axes[cols].set_title(f"{frequencies[cols]} Hz", va='bottom')
+        box = axes[cols].get_position()
+        axes[cols].set_position([box.x0, box.y0, box.width * 0.9, box.height * 0.9])
+        axes[cols].set_yticks([-40, -30, -20, -10, 0])
+
+    plt.show()
+
+if __name__ == "__main__":
+    main()
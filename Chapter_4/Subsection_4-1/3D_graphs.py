@@ -1,6 +1,6 @@
 import ComputationFunctions.ComputationFunctions as cf
 import numpy as np
-import matplotlib.pyplot as plt
+from ComputationFunctions.SurfaceCache import SurfaceCache
 
 c = 343
 phi = 180
@@ -11,28 +11,36 @@ resolution = 3000
 min_frequency = 20
 max_frequency = 20000
 
-# ------------------ GRAPH CALCULATIONS ------------------
-
-frequencies_to_display = np.arange(min_frequency, max_frequency, 10)
-radians_reference = np.linspace(0, 2 * np.pi, resolution)
-
-X, Y = np.meshgrid(radians_reference, frequencies_to_display)
-Z = np.empty((len(frequencies_to_display), resolution))
-for frequency in range(0, len(frequencies_to_display)):
-    beampattern = cf.cma_beampattern(theta, phi, frequencies_to_display[frequency], M, radius, c, resolution)
-    beampattern_amplitudes = cf.signal_to_decibels([abs(x) for x in beampattern])
-    Z[frequency] = beampattern_amplitudes
-    if frequencies_to_display[frequency] % 100 == 0:
-        print("Calculated already till "+str(frequencies_to_display[frequency])+" Hz")
-
-# ------------------ DISPLAYING PLOT ------------------
-
-ax = plt.axes(projection="3d")
-ax.plot_surface(X, Y, Z, cmap='winter', rstride=10, cstride=10, linewidth=0)
-ax.set_box_aspect([1, 3, 1])
-ax.set_title(f"CMA directivity pattern at radius {radius} meters", weight='bold')
-ax.set_xlabel("Degrees [radians]")
-ax.set_ylabel("Frequency [Hz]")
-ax.set_zlabel("Amplitude [dB]")
-plt.show()
-print("FINISHED")
\ No newline at end of file
+def main():
+    """ Calculates frequency x angle surface of the beam pattern, or loads it from the cache, and shows it in 3D """
+    import matplotlib.pyplot as plt
+
+    # ------------------ GRAPH CALCULATIONS ------------------
+
+    frequencies_to_display = np.arange(min_frequency, max_frequency, 10)
+    radians_reference = np.linspace(0, 2 * np.pi, resolution)
+
+    X, Y = np.meshgrid(radians_reference, frequencies_to_display)
+    # Frequency x angle surface is evaluated in batches of frequency rows which are written to the on-disk cache right
+    # away. Later runs with the same parameters only load it, an interrupted calculation continues where it stopped.
+    degrees_resolution = np.linspace(0, 360, resolution)
+    rows = SurfaceCache().response_rows(cf.cma_geometry(radius, M), theta, phi, degrees_resolution,
+                                        frequencies_to_display, c, decibels=True)
+    for indices, surface, calculated in rows:
+        print(f"Calculated already till {frequencies_to_display[indices.max()]} Hz")
+    Z = surface[:, 0, :]
+
+    # ------------------ DISPLAYING PLOT ------------------
+
+    ax = plt.axes(projection="3d")
+    ax.plot_surface(X, Y, Z, cmap='winter', rstride=10, cstride=10, linewidth=0)
+    ax.set_box_aspect([1, 3, 1])
+    ax.set_title(f"CMA directivity pattern at radius {radius} meters", weight='bold')
+    ax.set_xlabel("Degrees [radians]")
+    ax.set_ylabel("Frequency [Hz]")
+    ax.set_zlabel("Amplitude [dB]")
+    plt.show()
+    print("FINISHED")
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,10 @@ are defined in list "frequencies" in "VARIABLES DEFINITION" part of the script.
 has been generated for 2000, 4000, 6000, 10000, 14000 and 18000 Hz.
 """
 import numpy as np
-import matplotlib.pyplot as plt
-import soundfile as sf
 import ComputationFunctions.ComputationFunctions as cf
+from ComputationFunctions.MeasurementProcessing import find_recordings
+from ComputationFunctions.MeasurementAnalysis import directivity_matrix
+from ComputationFunctions.SurfaceCache import SurfaceCache, file_stamps
 
 # ------------------------------------------------------------
 # ------------------- VARIABLES DEFINITION -------------------
@@ -21,67 +22,48 @@ c = 343  # meters/second
 resolution = 100
 quantize_frequency = 48000  # Hz
 
-# -------------------------------------------------------------
-# ------------- REFERENCE BEAM PATTERN CALCULATION ------------
-# -------------------------------------------------------------
+def main():
+    """ Compares calculated and measured beam patterns in polar plots """
+    import matplotlib.pyplot as plt
 
-beampatterns_calculated = []
-for freq in frequencies:
-    beampattern_normal = cf.cma_beampattern(theta, phi, freq, M, radius, c, resolution)
-    amplitudes_normal = cf.signal_to_decibels([np.abs(x) for x in beampattern_normal])
+    # -------------------------------------------------------------
+    # ------------- REFERENCE BEAM PATTERN CALCULATION ------------
+    # -------------------------------------------------------------
 
-    beampatterns_calculated.append(amplitudes_normal)
+    beampatterns_calculated = []
+    for freq in frequencies:
+        beampattern_normal = cf.cma_beampattern(theta, phi, freq, M, radius, c, resolution)
+        amplitudes_normal = cf.signal_to_decibels(beampattern_normal)
 
-# -------------------------------------------------------------
-# ------------- REFERENCE BEAM PATTERN CALCULATION ------------
-# -------------------------------------------------------------
-beampatterns_measured = []
-for freq in frequencies:
-    spectral_values = np.zeros(100, dtype=float)
-    for i in range(0, 200, 2):
-        # Load data from files
-        wav_file_path = ""
-        if (i < 10):
-            wav_file_path = f"Processed_recordings/krok_00{i}_processed.wav"
-        elif (i < 100):
-            wav_file_path = f"Processed_recordings/krok_0{i}_processed.wav"
-        else:
-            wav_file_path = f"Processed_recordings/krok_{i}_processed.wav"
-        data, samplerate = sf.read(wav_file_path)
+        beampatterns_calculated.append(amplitudes_normal)
 
-        # Remove DC Offset
-        means = data.mean(0)
-        means_array = np.tile(means, (data.shape[0], 1))
-        for j in range(0, data.shape[0]):
-            data[j] = data[j].item() - means_array[j].item()
+    # -------------------------------------------------------------
+    # ------------- MEASURED BEAM PATTERN CALCULATION -------------
+    # -------------------------------------------------------------
+    # Every recording is read once and only the bins of the chosen frequencies are calculated. Spectral values of every
+    # frequency are normalized to 0 dB. The matrix is stored in the on-disk cache until any of the recordings changes.
+    recordings = find_recordings("Processed_recordings", "krok_*_processed.wav")
+    angles, spectral_values = SurfaceCache().get(lambda: directivity_matrix(recordings, frequencies),
+                                                 function="directivity_matrix", recordings=file_stamps(recordings),
+                                                 frequencies=frequencies)
+    beampatterns_measured = list(spectral_values.T)
 
-        # FFT analysis
-        spectrum = abs(np.fft.fft(data, axis=0))
-        chosen_frequency_sample_number = int(np.floor(data.shape[0] * freq / samplerate))
-        # Convert to decibels
-        spec_db = 20*np.log10(spectrum)
-        spectral_values[int(i/2)] = spec_db[chosen_frequency_sample_number]
+    # ------------------------------------------------
+    # --------------- DISPLAYING PLOTS ---------------
+    # ------------------------------------------------
+    reference_radians_values = np.linspace(0, 2 * np.pi, 100)
 
-    # -------- NORMALIZING SPECTRAL VALUES TO 0 dB --------
-    max_spectr_vals = spectral_values.max()
-    spectral_values = spectral_values - abs(max_spectr_vals)
-    beampatterns_measured.append(spectral_values)
-
-# ------------------------------------------------
-# --------------- DISPLAYING PLOTS ---------------
-# ------------------------------------------------
-reference_radians_values = np.linspace(0, 2 * np.pi, 100)
-
-fig, axes = plt.subplots(ncols=3, subplot_kw={'projection': 'polar'}, figsize=(10.3, 3), dpi=300)
-for cols in range(0, 3):
-    axes[cols].plot(reference_radians_values, beampatterns_calculated[cols], color='green', linewidth='1.2')
-    axes[cols].plot(reference_radians_values, beampatterns_measured[cols], color='red', linewidth='1.2')
-    axes[cols].set_ylim([-40, 0])
-    axes[cols].set_title(f"{frequencies[cols]} Hz", va='bottom')
-    box = axes[cols].get_position()
-    axes[cols].set_position([box.x0, box.y0, box.width * 0.9, box.height * 0.9])
-    axes[cols].set_yticks([-40, -30, -20, -10, 0])
-
-plt.show()
+    fig, axes = plt.subplots(ncols=3, subplot_kw={'projection': 'polar'}, figsize=(10.3, 3), dpi=300)
+    for cols in range(0, 3):
+        axes[cols].plot(reference_radians_values, beampatterns_calculated[cols], color='green', linewidth='1.2')
+        axes[cols].plot(reference_radians_values, beampatterns_measured[cols], color='red', linewidth='1.2')
+        axes[cols].set_ylim([-40, 0])
+        axes[cols].set_title(f"{frequencies[cols]} Hz", va='bottom')
+        box = axes[cols].get_position()
+        axes[cols].set_position([box.x0, box.y0, box.width * 0.9, box.height * 0.9])
+        axes[cols].set_yticks([-40, -30, -20, -10, 0])
 
+    plt.show()
 
+if __name__ == "__main__":
+    main()
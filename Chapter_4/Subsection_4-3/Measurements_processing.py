@@ -1,56 +1,58 @@
 """
 This script applies DSB algorithm to measured data by David Vágner, Jan Šedivý and David Ringsmuth. The output data
 are then stored in "Processed_recordings" folder.
+
+All krok_XXX.wav recordings of the measurement directory are processed in parallel. Recordings whose processed file
+is newer than the recording are skipped, use --force to process everything again. Run with --help to see all options.
 """
-import soundfile as sf
+import os
+import argparse
 import numpy as np
 import ComputationFunctions.ComputationFunctions as cf
+from ComputationFunctions.MeasurementProcessing import process_measurement_directory
 
 # ------------------------------------------------------------
 # ------------------- VARIABLES DEFINITION -------------------
 # ------------------------------------------------------------
-MIC_ORDER = [3, 4, 6, 0, 2, 5, 7, 1]  # Sorting channels in the correct positions
-radius = 0.05  # in meters
-M = 8
+# Positions of microphones and their order in the recordings (MIC_ORDER) are loaded from array_geometry.json
+geometry_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "array_geometry.json")
 phi = 0  # degrees
 theta = 90  # degrees
 c = 343  # meters/second
 sampling_frequency = 48000  # Hz
+fractional_order = None  # order of Lagrange fractional delay filters (e.g. 3), None for delays in whole samples
+measurement_directory = "measurement_2023-07-27_14-44"
+output_directory = "Processed_recordings"
 
-# -------------------------------------------------------------
-# ------------------- CALCULATION OF DELAYS -------------------
-# -------------------------------------------------------------
-delays_seconds = cf.cma_tmi(radius, M, phi, theta, c)
-delays_samples = cf.quantize_tmi_to_samples(delays_seconds, sampling_frequency)
-heighest_delay = max(delays_samples)
-
-# ----------------------------------------------------------------
-# ------------------- PROCESSING OF RECORDINGS -------------------
-# ----------------------------------------------------------------
-for i in range(0, 200, 2):
-    # Load data from files
-    wav_file = ""
-    if (i < 10):
-        wav_file = f"krok_00{i}"
-    elif (i < 100):
-        wav_file = f"krok_0{i}"
-    else:
-        wav_file = f"krok_{i}"
-    data, samplerate = sf.read("measurement_2023-07-27_14-44/" + wav_file + ".wav")
-    print(f"Processing of file {wav_file}.wav ...")
-
-    # Rearrange microphones in correct order
-    if data.shape[1] == 8:
-        data[:, [0, 1, 2, 3, 4, 5, 6, 7]] = data[:, MIC_ORDER]
+def main():
+    """ Parses the command line and processes all recordings of the measurement directory """
+    parser = argparse.ArgumentParser(description="Applies DSB algorithm to all recordings of a measurement directory.")
+    parser.add_argument("directory", nargs="?", default=measurement_directory, help="measurement directory")
+    parser.add_argument("output", nargs="?", default=output_directory, help="directory of processed recordings")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (all CPUs by default)")
+    parser.add_argument("--phi", type=float, default=phi, help="horizontal steering angle in degrees")
+    parser.add_argument("--geometry", default=geometry_config, help="JSON file with the array geometry")
+    parser.add_argument("--fractional-order", type=int, default=fractional_order,
+                        help="order of Lagrange fractional delay filters, delays in whole samples if not given")
+    parser.add_argument("--force", action="store_true", help="process also recordings which are up to date")
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64",
+                        help="data type of the processing, float32 halves the memory traffic")
+    arguments = parser.parse_args()
 
-    data_delayed = np.zeros((52815, M))
-    # Addition of delays
-    for channel_index in range(0, data.shape[1]):
-        data_delayed[:, channel_index] = np.pad(data[:, channel_index], (delays_samples[channel_index], heighest_delay-delays_samples[channel_index]), 'constant', constant_values=(0, 0))
+    # -------------------------------------------------------------
+    # ------------------- CALCULATION OF DELAYS -------------------
+    # -------------------------------------------------------------
+    geometry = cf.ArrayGeometry.from_config(arguments.geometry)
+    delays_samples = cf.array_sample_delays(geometry, arguments.phi, theta, c, sampling_frequency,
+                                            arguments.fractional_order is not None)
 
-    # Sum of all channels into a mono channel
-    sum_signal = np.sum(data_delayed, axis=1) / data.shape[1]
+    # ----------------------------------------------------------------
+    # ------------------- PROCESSING OF RECORDINGS -------------------
+    # ----------------------------------------------------------------
+    processed = process_measurement_directory(arguments.directory, arguments.output, delays_samples,
+                                              geometry.channel_map, arguments.fractional_order, arguments.workers,
+                                              arguments.force, dtype=np.dtype(arguments.dtype))
+    print(f"{len(processed)} files processed")
 
-    # Save files
-    sf.write(f'Processed_recordings/{wav_file}_processed.wav', sum_signal, samplerate)
-    print(f"File {wav_file}.wav processed!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
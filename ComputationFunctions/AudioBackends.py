@@ -0,0 +1,163 @@
+"""
+Audio sources and sinks of the real-time pipeline. Every backend calls the same stream callback
+callback(indata, outdata, frames, time, status) as sounddevice does, so the processing can run either on the audio
+device or headless on recorded files. File replay feeds a recording in blocks of fixed size, either paced to real time
+or as fast as possible, and optionally writes the output blocks to a file. sounddevice and soundfile are imported only
+by the backend which needs them.
+"""
+import time
+import threading
+import types
+import numpy as np
+from ComputationFunctions.Instrumentation import STATUS_FLAGS
+
+
+class ReplayFlags:
+    """ Status passed to the callback by the file replay, it has the same flags as sounddevice.CallbackFlags """
+    def __init__(self):
+        for flag in STATUS_FLAGS:
+            setattr(self, flag, False)
+
+    def __bool__(self):
+        return any(getattr(self, flag) for flag in STATUS_FLAGS)
+
+
+class SoundDeviceStream:
+    """ Stream of an audio device, sounddevice is imported only when this backend is used """
+    def __init__(self, samplerate: int, channels: tuple, blocksize: int, callback, device=None):
+        """
+        :param samplerate: sampling frequency in Hz
+        :param channels: number of input and output channels
+        :param blocksize: number of frames in every block
+        :param callback: stream callback with arguments (indata, outdata, frames, time, status)
+        :param device: input and output device id, e.g. (3, 4), default devices of sounddevice if not given
+        """
+        import sounddevice as sd
+        self._stream = sd.Stream(samplerate=samplerate, channels=channels, callback=callback, blocksize=blocksize,
+                                 device=device)
+        # Stream of a device never finishes by itself, the event is kept for the same interface as file replay
+        self.finished = threading.Event()
+
+    def wait(self, duration: float = None):
+        """ Waits while the stream is running, duration in seconds """
+        self.finished.wait(duration)
+
+    def __enter__(self):
+        self._stream.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stream.stop()
+        self._stream.close()
+
+
+class FileReplayStream:
+    """
+    Stream which replays a multichannel recording instead of an audio device. Blocks are read from the file and passed
+    to the callback from a background thread, the last block is padded with zeros. With realtime set the blocks are
+    paced to the sampling frequency and a block finished after its deadline sets output_underflow in the status of the
+    next block, otherwise blocks are processed as fast as possible.
+    """
+    def __init__(self, path: str, channels: tuple, blocksize: int, callback, realtime: bool = True,
+                 output_path: str = None, dtype: str = 'float32'):
+        """
+        :param path: replayed recording, it needs at least as many channels as the stream input
+        :param channels: number of input and output channels
+        :param blocksize: number of frames in every block
+        :param callback: stream callback with arguments (indata, outdata, frames, time, status)
+        :param realtime: pace the blocks to the sampling frequency of the recording
+        :param output_path: file the output blocks are written to, None to discard them
+        :param dtype: data type of the input blocks, sounddevice uses float32
+        """
+        import soundfile as sf
+        self.path = path
+        self.samplerate = sf.info(path).samplerate
+        self.channels_in, self.channels_out = channels
+        self.blocksize = blocksize
+        self.callback = callback
+        self.realtime = realtime
+        self.output_path = output_path
+        self.dtype = dtype
+        self.blocks = 0
+        self.elapsed = 0.0
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def wait(self, duration: float = None):
+        """ Waits until the whole recording is replayed, or at most duration seconds """
+        self.finished.wait(duration)
+
+    def __enter__(self):
+        self.finished.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._replay, name="FileReplayStream", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def _replay(self):
+        import soundfile as sf
+        indata = np.zeros((self.blocksize, self.channels_in), dtype=self.dtype)
+        outdata = np.zeros((self.blocksize, self.channels_out), dtype=self.dtype)
+        status = ReplayFlags()
+        output_file = None
+        if self.output_path is not None:
+            output_file = sf.SoundFile(self.output_path, 'w', self.samplerate, self.channels_out)
+        block_duration = self.blocksize / self.samplerate
+        start = time.perf_counter()
+        try:
+            for block in sf.blocks(self.path, blocksize=self.blocksize, dtype=self.dtype, always_2d=True):
+                if self._stop.is_set():
+                    break
+                frames = block.shape[0]
+                indata[:frames] = block[:, :self.channels_in]
+                indata[frames:] = 0
+                stream_time = self.blocks * block_duration
+                time_info = types.SimpleNamespace(inputBufferAdcTime=stream_time, currentTime=stream_time,
+                                                  outputBufferDacTime=stream_time + block_duration)
+                self.callback(indata, outdata, self.blocksize, time_info, status)
+                status.output_underflow = False
+                if output_file is not None:
+                    output_file.write(outdata)
+                self.blocks += 1
+                if self.realtime:
+                    delay = start + self.blocks * block_duration - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        status.output_underflow = True
+        finally:
+            self.elapsed = time.perf_counter() - start
+            if output_file is not None:
+                output_file.close()
+            self.finished.set()
+
+    def throughput(self) -> float:
+        """ Returns replayed audio duration divided by the wall clock time, e.g. 50 for 50x faster than real time """
+        return self.blocks * self.blocksize / self.samplerate / self.elapsed if self.elapsed else 0.0
+
+
+def open_stream(samplerate: int, channels: tuple, blocksize: int, callback, device=None, replay: str = None,
+                realtime: bool = True, output_path: str = None):
+    """
+    Creates stream of the audio device, or of a replayed recording if replay is given.
+    :param samplerate: sampling frequency in Hz, has to match the recording when replaying
+    :param channels: number of input and output channels
+    :param blocksize: number of frames in every block
+    :param callback: stream callback with arguments (indata, outdata, frames, time, status)
+    :param device: input and output device id of sounddevice
+    :param replay: path to a recording replayed instead of the audio device
+    :param realtime: pace replayed blocks to real time, otherwise process them as fast as possible
+    :param output_path: file the replayed output blocks are written to
+    :return: stream to be used as a context manager
+    """
+    if replay is None:
+        return SoundDeviceStream(samplerate, channels, blocksize, callback, device)
+    stream = FileReplayStream(replay, channels, blocksize, callback, realtime, output_path)
+    if stream.samplerate != samplerate:
+        raise ValueError(f"Recording {replay} has sampling frequency {stream.samplerate} Hz, not {samplerate} Hz")
+    return stream
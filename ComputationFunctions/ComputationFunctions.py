@@ -2,39 +2,76 @@
 Source code for all essential functions used along the thesis are defined in this python file. This is to avoid
 copying code used in other scripts.
 """
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from math import lgamma
 import numpy as np
 
 def degrees_to_radians(degrees):
     """ Converts degrees to radians """
     return degrees * (np.pi / 180)
 
-def signal_to_decibels(signal, reference=1):
-    """ Converts signal given in unitless format to decibels """
-    decibels = []
-    for i in signal:
-        decibels.append(10 * np.log10(i / reference))
-    return decibels
+def signal_to_decibels(signal, reference=1, out: np.ndarray = None, dtype=None) -> np.ndarray:
+    """
+    Converts signal given in unitless format to decibels. Complex signal (e.g. beam pattern) is converted straight
+    from its magnitude, all steps are done in place in the output array. Zeros are replaced by the smallest positive
+    number of the data type, so their result is finite and no warnings are raised. Negative real values give NaN.
+    :param signal: array of any shape, real or complex
+    :param reference: reference value of 0 dB
+    :param out: output array of the same shape, allocated if not given
+    :param dtype: data type of the output if out is not given, float32 for float32/complex64 signal, float64 otherwise
+    :return: array of decibels
+    """
+    signal = np.asarray(signal)
+    if out is None:
+        if dtype is None:
+            dtype = np.float32 if signal.dtype in (np.float32, np.complex64) else np.float64
+        out = np.empty(signal.shape, dtype=dtype)
+    if np.iscomplexobj(signal):
+        np.abs(signal, out=out)
+    else:
+        np.copyto(out, signal, casting='same_kind')
+    if reference != 1:
+        out /= reference
+    np.copyto(out, np.finfo(out.dtype).tiny, where=out == 0)
+    np.log10(out, out=out)
+    out *= 10
+    return out
 
-def quantize_tmi(latencies, sampling_frequency):
+def quantize_tmi(latencies, sampling_frequency, out: np.ndarray = None) -> np.ndarray:
+    """
+    Quantizes latencies to whole multiples of the sampling period.
+    :param latencies: latency in seconds or array of latencies of any shape
+    :param sampling_frequency: Sampling frequency for quantization.
+    :param out: floating point output array of the same shape, allocated if not given
+    :return: Array of quantized latencies in seconds, of shape () for a single latency.
+    """
     minimum_latency = (1 / sampling_frequency)
-    result = []
-    for i in latencies:
-        result.append(round(i / minimum_latency)*minimum_latency)
-    return result
+    latencies = np.asarray(latencies, dtype=float)
+    if out is None:
+        out = np.empty(latencies.shape)
+    elif not np.issubdtype(out.dtype, np.floating):
+        raise TypeError("Output array of quantize_tmi has to be a floating point array")
+    np.divide(latencies, minimum_latency, out=out)
+    np.round(out, out=out)
+    out *= minimum_latency
+    return out
 
-def quantize_tmi_to_samples(latencies: list, sampling_frequency: int) -> list:
+def quantize_tmi_to_samples(latencies, sampling_frequency: int, out: np.ndarray = None) -> np.ndarray:
     """
     Takes an array of latencies as an input and returns them back quantized to a given sampling frequency.
     Most common sampling frequencies are 44.1 kHz, 48 kHz and 96 kHz.
-    :param latencies: input Latencies ment to be quantized.
+    :param latencies: input Latencies ment to be quantized, array of any shape.
     :param sampling_frequency: Sampling frequency for quantization.
-    :return: Array of latencies quantized to certain sampling frequency.
+    :param out: integer output array of the same shape, allocated if not given
+    :return: Array of latencies quantized to certain sampling frequency in samples.
     """
     minimum_latency = (1 / sampling_frequency)
-    result = []
-    for i in latencies:
-        result.append(round(i / minimum_latency))
-    return result
+    samples = np.divide(np.asarray(latencies, dtype=float), minimum_latency)
+    if out is None:
+        out = np.empty(samples.shape, dtype=int)
+    return np.rint(samples, out=out, casting='unsafe')
 
 def cma_tmi(radius: float, M: int, phi_angle: float, theta_angle: float, c: int) -> list:
     """
@@ -47,28 +84,539 @@ def cma_tmi(radius: float, M: int, phi_angle: float, theta_angle: float, c: int)
     :param c: speed of sound
     :return: list of delays where every index of the list corresponds to the microphone index delay
     """
-    latencies = []
-    k_hat_vector = np.array([
-        np.sin(degrees_to_radians(theta_angle)) * np.cos(degrees_to_radians(phi_angle)),
-        np.sin(degrees_to_radians(theta_angle)) * np.sin(degrees_to_radians(phi_angle)),
-        np.cos(degrees_to_radians(theta_angle))
-    ])
-    # Dot product for k_hat and r_m_i for all mics
-    for mic_id in range(M):
-        rm_vector = radius * np.array([
-            np.cos(2 * np.pi * (mic_id / M)),
-            np.sin(2 * np.pi * (mic_id / M)),
-            0
-        ])
-        t_m_i = np.dot(k_hat_vector, rm_vector)/c
-        latencies.append(t_m_i)
-    # Find smallest t_m_i and adds it to the latencies according to fomrula 1.2
-    t_m_c = np.max(latencies)
-    for i in range(M):
-        latencies[i] = t_m_c - latencies[i]
-    return latencies
-
-def cma_beampattern(theta: float, phi: float, frequency: int, M: int, radius: float, c: int, resolution: int) -> list:
+    return list(cma_tmi_matrix(radius, M, phi_angle, theta_angle, c)[0])
+
+class DelayCache:
+    """
+    Bounded least recently used cache of delay tables. Keys are tuples describing the array geometry, the angles, the
+    speed of sound and the quantization, values are read-only numpy arrays. Hits and misses are counted so that the
+    size of the cache can be tuned for a given sweep.
+    """
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, compute) -> np.ndarray:
+        """
+        Returns cached value for a given key, calculating and storing it by calling compute() if it is not present.
+        Least recently used entry is evicted when the cache is full.
+        :param key: hashable key of the delay table
+        :param compute: function without arguments which calculates the delay table
+        :return: read-only delay table
+        """
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = compute()
+            value.setflags(write=False)
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return value
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def info(self) -> dict:
+        """ Returns hit and miss counters together with the maximal and current number of entries """
+        return {"hits": self.hits, "misses": self.misses, "maxsize": self.maxsize, "currsize": len(self._entries)}
+
+    def clear(self):
+        """ Removes all entries and resets counters """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+# Delay tables shared by all array geometries
+delay_cache = DelayCache()
+
+class ArrayGeometry:
+    """
+    Microphone array geometry with arbitrary 3D positions of all microphones precomputed once in a (M, 3) matrix.
+    Channel map holds the input channel of every microphone, e.g. (4, 0, 5, 1, 6, 2, 7, 3). Delay tables calculated
+    from the geometry are stored in the shared delay_cache, so sweeps over frequencies reuse them.
+    """
+    def __init__(self, positions, channel_map: list = None, cache: DelayCache = None):
+        self.positions = np.array(positions, dtype=float)
+        self.positions.setflags(write=False)
+        self.M = self.positions.shape[0]
+        self.channel_map = np.arange(self.M) if channel_map is None else np.asarray(channel_map, dtype=int)
+        if self.channel_map.shape != (self.M,):
+            raise ValueError(f"Channel map has to contain one input channel for each of {self.M} microphones")
+        self.key = (self.positions.shape, self.positions.tobytes())
+        self.cache = delay_cache if cache is None else cache
+        # Radius of uniform circular array created by circular(), enables closed-form response
+        self.radius = None
+
+    @classmethod
+    def circular(cls, radius: float, M: int, channel_map: list = None, cache: DelayCache = None) -> "ArrayGeometry":
+        """
+        Creates uniform circular microphone array lying in the z=0 plane, microphone 0 is placed on the x axis.
+        :param radius: radius of circular microphone array
+        :param M: number of microphones in circular microphone array
+        :param channel_map: input channel of every microphone, identity by default
+        :param cache: delay cache used by the geometry, shared delay_cache by default
+        :return: geometry of circular microphone array
+        """
+        mic_angles = 2 * np.pi * (np.arange(M) / M)
+        geometry = cls(radius * np.stack([np.cos(mic_angles), np.sin(mic_angles), np.zeros(M)], axis=-1),
+                       channel_map, cache)
+        geometry.radius = radius
+        return geometry
+
+    @classmethod
+    def concentric(cls, radii: list, mics_per_ring: list, channel_map: list = None,
+                   cache: DelayCache = None) -> "ArrayGeometry":
+        """
+        Creates concentric uniform circular rings lying in the z=0 plane, microphones are numbered ring by ring.
+        :param radii: radius of every ring
+        :param mics_per_ring: number of microphones of every ring
+        :param channel_map: input channel of every microphone, identity by default
+        :param cache: delay cache used by the geometry, shared delay_cache by default
+        :return: geometry of concentric circular microphone array
+        """
+        rings = [cls.circular(radius, M).positions for radius, M in zip(radii, mics_per_ring)]
+        return cls(np.concatenate(rings), channel_map, cache)
+
+    @classmethod
+    def linear(cls, M: int, spacing: float, channel_map: list = None, cache: DelayCache = None) -> "ArrayGeometry":
+        """
+        Creates uniform linear microphone array lying on the x axis and centered at the origin.
+        :param M: number of microphones
+        :param spacing: distance between two neighbouring microphones
+        :param channel_map: input channel of every microphone, identity by default
+        :param cache: delay cache used by the geometry, shared delay_cache by default
+        :return: geometry of linear microphone array
+        """
+        x = (np.arange(M) - (M - 1) / 2) * spacing
+        return cls(np.stack([x, np.zeros(M), np.zeros(M)], axis=-1), channel_map, cache)
+
+    @classmethod
+    def from_config(cls, path: str) -> "ArrayGeometry":
+        """
+        Loads geometry from a JSON file. The file contains "type" (circular, concentric, linear or positions), the
+        parameters of the corresponding constructor and optional "channel_map", e.g.
+        {"type": "circular", "radius": 0.05, "M": 8, "channel_map": [4, 0, 5, 1, 6, 2, 7, 3]} or
+        {"type": "positions", "positions": [[0.05, 0, 0], [0, 0.05, 0], ...]}.
+        :param path: path to the JSON file
+        :return: geometry described by the file
+        """
+        with open(path) as config_file:
+            config = json.load(config_file)
+        geometry_type = config.pop("type", "positions")
+        constructors = {"circular": cls.circular, "concentric": cls.concentric, "linear": cls.linear,
+                        "positions": cls}
+        if geometry_type not in constructors:
+            raise ValueError(f"Unknown geometry type {geometry_type}, use one of {', '.join(constructors)}")
+        return constructors[geometry_type](**config)
+
+    def delays(self, phi_angles, theta_angle: float, c: float, sf: int = None) -> np.ndarray:
+        """
+        Returns delays on all microphones for one or more horizontal angles according to formula 1.2. Results are
+        cached, quantized and continuous delays are stored separately.
+        :param phi_angles: horizontal angle or array of horizontal angles of a sound source in degrees
+        :param theta_angle: vertical angle of a sound source
+        :param c: speed of sound
+        :param sf: sampling frequency the delays are quantized to, None for no quantization
+        :return: read-only array of shape (number of angles, M) with delays in seconds
+        """
+        phi_angles = np.atleast_1d(np.asarray(phi_angles, dtype=float))
+        key = (self.key, phi_angles.tobytes(), float(theta_angle), float(c), sf)
+        if sf is None:
+            return self.cache.get(key, lambda: self._compute_delays(phi_angles, theta_angle, c))
+        minimum_latency = (1 / sf)
+        # Continuous delays are looked up only when the quantized ones are not cached
+        return self.cache.get(key, lambda: np.round(self.delays(phi_angles, theta_angle, c) / minimum_latency)
+                              * minimum_latency)
+
+    def _compute_delays(self, phi_angles: np.ndarray, theta_angle: float, c: float) -> np.ndarray:
+        phi = degrees_to_radians(phi_angles)
+        theta = degrees_to_radians(theta_angle)
+        k_hat_vectors = np.stack([
+            np.sin(theta) * np.cos(phi),
+            np.sin(theta) * np.sin(phi),
+            np.full(phi.shape, np.cos(theta))
+        ], axis=-1)
+        # Dot product for k_hat and r_m_i for all angles and all mics
+        t_m_i = (k_hat_vectors @ self.positions.T) / c
+        # Find smallest t_m_i and adds it to the latencies according to fomrula 1.2
+        t_m_c = t_m_i.max(axis=1, keepdims=True)
+        return t_m_c - t_m_i
+
+@lru_cache(maxsize=32)
+def cma_geometry(radius: float, M: int) -> ArrayGeometry:
+    """ Returns geometry of circular microphone array, geometries are created only once for each radius and M """
+    return ArrayGeometry.circular(radius, M)
+
+def array_sample_delays(geometry: ArrayGeometry, phi_angles, theta_angle: float, c: int, sf: int,
+                        fractional: bool = False) -> np.ndarray:
+    """
+    Calculates delays on all microphones of any array geometry in samples, either quantized to whole samples or
+    fractional.
+    :param geometry: geometry of the microphone array
+    :param phi_angles: horizontal angle or array of horizontal angles of a sound source in degrees
+    :param theta_angle: vertical angle of a sound source
+    :param c: speed of sound
+    :param sf: sampling frequency in Hz
+    :param fractional: True to keep fractional part of the delays
+    :return: array of delays in samples of shape (M,) for a single angle or (angles, M)
+    """
+    delays = geometry.delays(phi_angles, theta_angle, c) * sf
+    if not fractional:
+        delays = np.round(delays).astype(int)
+    return delays[0] if np.ndim(phi_angles) == 0 else delays
+
+def cma_tmi_matrix(radius: float, M: int, phi_angles, theta_angle: float, c: int) -> np.ndarray:
+    """
+    Calculates delay times on all microphones in circular microphone array for several horizontal angles at once.
+    Row n of the result holds the same delays as cma_tmi(radius, M, phi_angles[n], theta_angle, c).
+    :param radius: radius of circular microphone array
+    :param M: number of microphones in circular microphone array
+    :param phi_angles: horizontal angle or array of horizontal angles of a sound source in degrees
+    :param theta_angle: vertical angle of a sound source
+    :param c: speed of sound
+    :return: read-only array of shape (number of angles, M) with delays in seconds
+    """
+    return cma_geometry(radius, M).delays(phi_angles, theta_angle, c)
+
+def cma_sample_delays(radius: float, M: int, phi_angles, theta_angle: float, c: int, sf: int,
+                      fractional: bool = False) -> np.ndarray:
+    """
+    Calculates delays on all microphones in samples, either quantized to whole samples or fractional.
+    :param radius: radius of circular microphone array
+    :param M: number of microphones in circular microphone array
+    :param phi_angles: horizontal angle or array of horizontal angles of a sound source in degrees
+    :param theta_angle: vertical angle of a sound source
+    :param c: speed of sound
+    :param sf: sampling frequency in Hz
+    :param fractional: True to keep fractional part of the delays
+    :return: array of delays in samples of shape (M,) for a single angle or (angles, M)
+    """
+    return array_sample_delays(cma_geometry(radius, M), phi_angles, theta_angle, c, sf, fractional)
+
+# Upper bound of the temporary arrays used by cma_response, in bytes
+RESPONSE_MAX_BYTES = 256 * 1024 ** 2
+
+def complex_dtype(dtype) -> np.dtype:
+    """ Returns complex data type of the same precision as a real data type, e.g. complex64 for float32 """
+    return np.result_type(dtype, np.complex64)
+
+# Maximal absolute error of the closed-form (Bessel) response
+BESSEL_TOLERANCE = 1e-10
+# Cost of one Bessel function of higher order relative to one complex exponential of the direct sum
+BESSEL_TERM_COST = 16
+
+def _bessel_functions():
+    """ Returns scipy.special.j0 and jv, or None if scipy is not installed """
+    try:
+        from scipy.special import j0, jv
+    except ImportError:
+        return None
+    return j0, jv
+
+def bessel_terms(x_max: float, M: int, tolerance: float = BESSEL_TOLERANCE) -> tuple:
+    """
+    Finds number of terms Q of the Jacobi-Anger expansion of uniform circular array response
+    J_0(x) + 2 * sum_{q=1}^{Q} (-j)^(qM) * J_qM(x) * cos(qM * psi) which keeps the truncation error below tolerance.
+    Since |J_n(x)| <= (x / 2)^n / n! and for n >= x every next omitted term is at most half of the previous one, the
+    error is bounded by 4 * (x / 2)^n / n! with n = (Q + 1) * M.
+    :param x_max: largest argument of the Bessel functions, 2 * ro * radius * sin(theta) / c
+    :param M: number of microphones in circular microphone array
+    :param tolerance: maximal absolute error of the response
+    :return: tuple of number of terms Q and the error bound
+    """
+    q = 0
+    while True:
+        n = (q + 1) * M
+        if x_max == 0:
+            return q, 0.0
+        log_bound = np.log(4) + n * np.log(x_max / 2) - lgamma(n + 1)
+        if n >= x_max and log_bound <= np.log(tolerance):
+            return q, float(np.exp(log_bound))
+        q += 1
+
+def uca_response_bessel(radius: float, M: int, theta: float, steering_phi, look_phi, frequencies, c: int,
+                        tolerance: float = BESSEL_TOLERANCE, max_bytes: int = RESPONSE_MAX_BYTES,
+                        dtype=np.float64) -> np.ndarray:
+    """
+    Calculates the same response as cma_response without quantization by the closed-form Jacobi-Anger expansion. Delay
+    differences of formula 1.4 are radius * sin(theta) / c * rho * cos(psi - phi_m), where rho and psi are length and
+    angle of the difference of unit vectors of the steering and look angle, so the sum over microphones becomes a sum
+    of Bessel functions whose number of terms depends on frequency and radius, not on M (see bessel_terms).
+    :param radius: radius of circular microphone array
+    :param M: number of microphones in circular microphone array
+    :param theta: vertical angle of a sound source
+    :param steering_phi: horizontal angle or array of horizontal angles the array is steered to
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequency or array of frequencies in Hz
+    :param c: speed of sound
+    :param tolerance: maximal absolute error of the response
+    :param max_bytes: memory budget of the temporary arrays in bytes
+    :param dtype: real data type whose complex counterpart is returned, Bessel functions are evaluated in float64
+    :return: complex array of shape (frequencies, steering angles, look angles)
+    """
+    bessel = _bessel_functions()
+    if bessel is None:
+        raise ImportError("Closed-form response needs scipy, install it or use method='direct'")
+    j0, jv = bessel
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    steering = degrees_to_radians(np.atleast_1d(np.asarray(steering_phi, dtype=float)))
+    look = degrees_to_radians(np.atleast_1d(np.asarray(look_phi, dtype=float)))
+    scale = radius * np.sin(degrees_to_radians(theta)) / c
+    ux = np.cos(steering)[:, np.newaxis] - np.cos(look)[np.newaxis, :]
+    uy = np.sin(steering)[:, np.newaxis] - np.sin(look)[np.newaxis, :]
+    rho = np.hypot(ux, uy)
+    psi = np.arctan2(uy, ux)
+    # Delays of formula 1.2 are relative to the latest microphone, which adds a phase of the difference of t_m_c
+    mic_angles = 2 * np.pi * (np.arange(M) / M)
+    t_m_c = scale * np.cos(np.concatenate((steering, look))[:, np.newaxis] - mic_angles).max(axis=1)
+    common = t_m_c[:steering.size, np.newaxis] - t_m_c[np.newaxis, steering.size:]
+
+    response = np.empty((frequencies.size, steering.size, look.size), dtype=complex_dtype(dtype))
+    frequency_step = int(max(1, max_bytes // (4 * rho.size * np.dtype(complex).itemsize)))
+    for f_start in range(0, frequencies.size, frequency_step):
+        ro = 2 * np.pi * frequencies[f_start:f_start + frequency_step, np.newaxis, np.newaxis]
+        x = (ro * scale) * rho
+        terms, _ = bessel_terms(2 * float(np.abs(ro).max()) * abs(scale), M, tolerance)
+        chunk = j0(x).astype(complex)
+        for q in range(1, terms + 1):
+            n = q * M
+            chunk += (2 * (-1j) ** (n % 4)) * jv(n, x) * np.cos(n * psi)
+        chunk *= np.exp(1j * ro * common)
+        response[f_start:f_start + frequency_step] = chunk
+    return response
+
+def array_response(geometry: ArrayGeometry, theta: float, steering_phi, look_phi, frequencies, c: int,
+                   sf: int = None, max_bytes: int = RESPONSE_MAX_BYTES, method: str = "auto",
+                   tolerance: float = BESSEL_TOLERANCE, dtype=np.float64) -> np.ndarray:
+    """
+    Calculates complex response of delay-and-sum beamformer of any array geometry for every combination of frequency,
+    steering angle and look angle in one broadcasted evaluation of formula 1.4. The (steering angle x look angle x
+    microphone) phase tensor is evaluated in chunks over look angles and frequencies in preallocated buffers, which
+    together take at most max_bytes regardless of the size of the grid (at least one look angle and one frequency are
+    evaluated at once, so a budget smaller than steering angles x microphones x 3 values is exceeded).
+    :param geometry: geometry of the microphone array
+    :param theta: vertical angle of a sound source
+    :param steering_phi: horizontal angle or array of horizontal angles the array is steered to
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequency or array of frequencies in Hz
+    :param c: speed of sound
+    :param sf: sampling frequency the steering delays are quantized to, None for no quantization
+    :param max_bytes: memory budget of the temporary delay differences and phases in bytes
+    :param method: "direct" sum over microphones, closed-form "bessel" for uniform circular arrays (see
+                   uca_response_bessel) or "auto", which uses the closed form when it is available and cheaper
+    :param tolerance: maximal absolute error of the closed-form response
+    :param dtype: real data type of the phases, float32 gives complex64 response with half of the memory traffic
+    :return: complex array of shape (frequencies, steering angles, look angles)
+    """
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    M = geometry.M
+    if method != "direct" and geometry.radius is not None and sf is None:
+        x_max = 4 * np.pi * np.abs(frequencies).max(initial=0) * geometry.radius * abs(
+            np.sin(degrees_to_radians(theta))) / c
+        terms, _ = bessel_terms(x_max, M, tolerance)
+        if method == "bessel" or (terms * BESSEL_TERM_COST + 1 < M and _bessel_functions() is not None):
+            return uca_response_bessel(geometry.radius, M, theta, steering_phi, look_phi, frequencies, c, tolerance,
+                                       max_bytes, dtype)
+    elif method == "bessel":
+        raise ValueError("Closed-form response is available only for circular geometry without quantization")
+    steering_delays = geometry.delays(steering_phi, theta, c, sf)
+    look_delays = geometry.delays(look_phi, theta, c)
+    n_steering, n_look = steering_delays.shape[0], look_delays.shape[0]
+    response = np.empty((frequencies.size, n_steering, n_look), dtype=complex_dtype(dtype))
+
+    # Split the look angles first if a single frequency does not fit into the budget, then group frequencies. The
+    # budget covers one real delay difference per look angle and one complex phase per frequency and look angle
+    bytes_per_look = n_steering * M * np.dtype(dtype).itemsize
+    look_step = int(min(n_look, max(1, max_bytes // (bytes_per_look * 3))))
+    frequency_step = 1
+    if look_step == n_look:
+        frequency_step = int(max(1, (max_bytes // (bytes_per_look * n_look) - 1) // 2))
+    frequency_step = min(frequency_step, frequencies.size)
+    differences = np.empty((n_steering, look_step, M), dtype=dtype)
+    phases = np.empty((frequency_step, n_steering, look_step, M), dtype=response.dtype)
+    for l_start in range(0, n_look, look_step):
+        l_stop = min(l_start + look_step, n_look)
+        # Delay differences of formula 1.4 for every steering angle, look angle of the chunk and microphone
+        chunk_differences = differences[:, :l_stop - l_start]
+        np.subtract(steering_delays[:, np.newaxis, :], look_delays[np.newaxis, l_start:l_stop, :],
+                    out=chunk_differences, casting="same_kind")
+        for f_start in range(0, frequencies.size, frequency_step):
+            f_stop = min(f_start + frequency_step, frequencies.size)
+            ro = (2 * np.pi * frequencies[f_start:f_stop, np.newaxis, np.newaxis, np.newaxis]).astype(dtype)
+            chunk_phases = phases[:f_stop - f_start, :, :l_stop - l_start]
+            np.multiply(1j * ro, chunk_differences, out=chunk_phases)
+            np.exp(chunk_phases, out=chunk_phases)
+            chunk_phases.sum(axis=-1, out=response[f_start:f_stop, :, l_start:l_stop])
+    response /= M
+    return response
+
+def cma_response(theta: float, steering_phi, look_phi, frequencies, M: int, radius: float, c: int, sf: int = None,
+                 max_bytes: int = RESPONSE_MAX_BYTES, method: str = "auto", dtype=np.float64) -> np.ndarray:
+    """
+    Calculates complex response of circular microphone array for every combination of frequency, steering angle and
+    look angle, see array_response.
+    :param theta: vertical angle of a sound source
+    :param steering_phi: horizontal angle or array of horizontal angles the array is steered to
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequency or array of frequencies in Hz
+    :param M: number of microphones in circular microphone array
+    :param radius: radius of circular microphone array
+    :param c: speed of sound
+    :param sf: sampling frequency the steering delays are quantized to, None for no quantization
+    :param max_bytes: memory budget of the temporary arrays in bytes, see array_response
+    :param method: "direct", "bessel" or "auto", see array_response
+    :param dtype: real data type of the calculation, float32 gives complex64 response
+    :return: complex array of shape (frequencies, steering angles, look angles)
+    """
+    return array_response(cma_geometry(radius, M), theta, steering_phi, look_phi, frequencies, c, sf, max_bytes,
+                          method, dtype=dtype)
+
+def refinement_order(n: int, levels: int = 4) -> np.ndarray:
+    """
+    Orders indices 0..n-1 from coarse to fine. Every 2 ** (levels - 1)-th index comes first, then the step is halved
+    level by level, so any prefix of the order is a decimated version of the whole grid.
+    :param n: number of indices
+    :param levels: number of refinement levels
+    :return: permutation of indices 0..n-1
+    """
+    order = []
+    taken = np.zeros(n, dtype=bool)
+    for level in range(levels - 1, -1, -1):
+        indices = np.arange(0, n, 2 ** level)
+        indices = indices[~taken[indices]]
+        taken[indices] = True
+        order.append(indices)
+    return np.concatenate(order)
+
+def array_response_rows(geometry: ArrayGeometry, theta: float, steering_phi, look_phi, frequencies, c: int,
+                        sf: int = None, progressive: bool = False, levels: int = 4, rows: int = 32,
+                        max_bytes: int = RESPONSE_MAX_BYTES, dtype=np.float64):
+    """
+    Calculates the same response as array_response, but yields it in groups of frequency rows as soon as they are
+    finished, so a plot or an analysis can start before the whole surface is done.
+    :param geometry: geometry of the microphone array
+    :param theta: vertical angle of a sound source
+    :param steering_phi: horizontal angle or array of horizontal angles the array is steered to
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequency or array of frequencies in Hz
+    :param c: speed of sound
+    :param sf: sampling frequency the steering delays are quantized to, None for no quantization
+    :param progressive: yield rows in coarse-to-fine order (see refinement_order) instead of ascending frequencies
+    :param levels: number of refinement levels of the progressive order
+    :param rows: number of frequency rows in one yielded group
+    :param max_bytes: memory budget of the temporary arrays in bytes, see array_response
+    :param dtype: real data type of the calculation, float32 gives complex64 response
+    :return: generator of (indices of the frequencies, complex array of shape (indices, steering angles, look angles))
+    """
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    order = refinement_order(frequencies.size, levels) if progressive else np.arange(frequencies.size)
+    for start in range(0, order.size, rows):
+        indices = order[start:start + rows]
+        yield indices, array_response(geometry, theta, steering_phi, look_phi, frequencies[indices], c, sf, max_bytes,
+                                      dtype=dtype)
+
+def cma_response_rows(theta: float, steering_phi, look_phi, frequencies, M: int, radius: float, c: int,
+                      sf: int = None, progressive: bool = False, levels: int = 4, rows: int = 32,
+                      dtype=np.float64):
+    """
+    Yields response of circular microphone array in groups of frequency rows, see array_response_rows.
+    :return: generator of (indices of the frequencies, complex array of shape (indices, steering angles, look angles))
+    """
+    yield from array_response_rows(cma_geometry(radius, M), theta, steering_phi, look_phi, frequencies, c, sf,
+                                   progressive, levels, rows, dtype=dtype)
+
+def array_response_weighted(geometry: ArrayGeometry, theta: float, weights: np.ndarray, look_phi, frequencies,
+                            c: int, max_bytes: int = RESPONSE_MAX_BYTES, dtype=np.float64) -> np.ndarray:
+    """
+    Calculates complex response of microphone array whose microphones are combined with arbitrary complex weights,
+    H = sum over m of w_m * exp(-j * ro * t_m_i) for every look angle. Delay-and-sum beamformer of formula 1.4
+    corresponds to weights exp(j * ro * t_m_i) / M of the steering direction.
+    :param geometry: geometry of the microphone array
+    :param theta: vertical angle of a sound source
+    :param weights: complex weights of shape (frequencies, beams, M)
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequency or array of frequencies in Hz, one for every row of weights
+    :param c: speed of sound
+    :param max_bytes: memory budget of the temporary steering tensor in bytes
+    :param dtype: real data type of the calculation, float32 gives complex64 response
+    :return: complex array of shape (frequencies, beams, look angles)
+    """
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    weights = np.asarray(weights, dtype=complex_dtype(dtype))
+    look_delays = geometry.delays(look_phi, theta, c).astype(dtype)
+    response = np.empty((frequencies.size, weights.shape[1], look_delays.shape[0]), dtype=weights.dtype)
+    frequency_step = int(max(1, max_bytes // (look_delays.size * response.itemsize)))
+    for f_start in range(0, frequencies.size, frequency_step):
+        ro = (2 * np.pi * frequencies[f_start:f_start + frequency_step, np.newaxis, np.newaxis]).astype(dtype)
+        look_vectors = np.exp(-1j * ro * look_delays.T[np.newaxis, :, :])
+        response[f_start:f_start + frequency_step] = weights[f_start:f_start + frequency_step] @ look_vectors
+    return response
+
+def cma_response_weighted(theta: float, weights: np.ndarray, look_phi, frequencies, M: int, radius: float, c: int,
+                          max_bytes: int = RESPONSE_MAX_BYTES, dtype=np.float64) -> np.ndarray:
+    """
+    Calculates complex response of circular microphone array with arbitrary complex weights, see
+    array_response_weighted.
+    :param theta: vertical angle of a sound source
+    :param weights: complex weights of shape (frequencies, beams, M)
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequency or array of frequencies in Hz, one for every row of weights
+    :param M: number of microphones in circular microphone array
+    :param radius: radius of circular microphone array
+    :param c: speed of sound
+    :param max_bytes: memory budget of the temporary steering tensor in bytes
+    :param dtype: real data type of the calculation, float32 gives complex64 response
+    :return: complex array of shape (frequencies, beams, look angles)
+    """
+    return array_response_weighted(cma_geometry(radius, M), theta, weights, look_phi, frequencies, c, max_bytes,
+                                   dtype)
+
+def lagrange_fractional_delay(sample_delays, order: int = 3) -> tuple:
+    """
+    Splits delays given in (fractional) samples into integer delays and Lagrange interpolation FIR filters of a given
+    order. Every channel gets additional common delay of order // 2 samples, which keeps the fractional part of the
+    filters in the middle of the filter where the interpolation is the most accurate. The common delay does not
+    change the beam pattern.
+    :param sample_delays: delays in samples, can be fractional
+    :param order: order of the Lagrange interpolation, 0 corresponds to rounding to whole samples
+    :return: tuple of integer delays, filter taps of shape (delays, order + 1) and the common delay in samples
+    """
+    sample_delays = np.asarray(sample_delays, dtype=float)
+    common_delay = order // 2
+    total_delays = sample_delays + common_delay
+    integer_delays = np.maximum(np.ceil(total_delays - (order + 1) / 2), 0).astype(int)
+    fractions = total_delays - integer_delays
+    n = np.arange(order + 1)
+    taps = np.ones(sample_delays.shape + (order + 1,))
+    for k in range(order + 1):
+        factors = (fractions[..., np.newaxis] - k) / np.where(n == k, 1, n - k)
+        taps *= np.where(n == k, 1, factors)
+    return integer_delays, taps, common_delay
+
+def fractional_steering_weights(delays, frequencies, sf: int, order: int = 3) -> np.ndarray:
+    """
+    Calculates weights of delay-and-sum beamformer whose delays are realized by integer delays and Lagrange fractional
+    delay filters. Weights can be evaluated by cma_response_weighted.
+    :param delays: delays in seconds of shape (beams, M), e.g. from cma_tmi_matrix
+    :param frequencies: frequency or array of frequencies in Hz
+    :param sf: sampling frequency of the beamformer
+    :param order: order of the Lagrange interpolation
+    :return: complex weights of shape (frequencies, beams, M)
+    """
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    integer_delays, taps, common_delay = lagrange_fractional_delay(np.asarray(delays) * sf, order)
+    M = integer_delays.shape[-1]
+    ro = 2 * np.pi * frequencies[:, np.newaxis, np.newaxis] / sf
+    # Frequency response of every filter, common delay is compensated to keep phase of formula 1.4
+    filter_response = np.einsum('fk,smk->fsm', np.exp(-1j * ro[:, 0] * np.arange(order + 1)), taps)
+    filter_response *= np.exp(-1j * ro * integer_delays)
+    return np.conj(filter_response) * np.exp(-1j * ro * common_delay) / M
+
+def cma_beampattern(theta: float, phi: float, frequency: int, M: int, radius: float, c: int, resolution: int) -> np.ndarray:
     """
     This function calculates beam pattern of circular microphone array. Beam pattern is calculated in frequency domain,
     therefore frequency as a parameter is required. Returned data are best displayed on polar plot.
@@ -79,22 +627,13 @@ def cma_beampattern(theta: float, phi: float, frequency: int, M: int, radius: fl
     :param radius: radius of circular microphone array
     :param c: speed of sound
     :param resolution: number of points that should be generated in range of 0..360 degrees
-    :return: list of all magnitudes of the signals dispersed in directions of 0.360 degrees
+    :return: array of complex responses in directions of 0..360 degrees
     """
-    ro = 2 * np.pi * frequency
-    beampattern = []
-    tmcmi = cma_tmi(radius, M, phi, theta, c)
     degrees_resolution = np.linspace(0, 360, resolution)
     # Calculate H_DSB according to formula 1.4
-    for phi_s in degrees_resolution:
-        kj = cma_tmi(radius, M, phi_s, theta, c)
-        sum = 0
-        for index in range(0, M):
-            sum += np.exp(1j * ro * (tmcmi[index] - kj[index]))
-        beampattern.append(sum / M)
-    return beampattern
+    return cma_response(theta, phi, degrees_resolution, frequency, M, radius, c)[0, 0]
 
-def cma_beampattern_quantization(theta: float, phi: float, frequency: int, M: int, radius: float, c: int, resolution: int, sf: int) -> list:
+def cma_beampattern_quantization(theta: float, phi: float, frequency: int, M: int, radius: float, c: int, resolution: int, sf: int) -> np.ndarray:
     """
     This function calculates beam pattern of circular microphone array. Beam pattern is calculated in frequency domain,
     therefore frequency as a parameter is required. Returned data are best displayed on polar plot.
@@ -105,17 +644,56 @@ def cma_beampattern_quantization(theta: float, phi: float, frequency: int, M: in
     :param radius: radius of circular microphone array
     :param c: speed of sound
     :param resolution: number of points that should be generated in range of 0..360 degrees
-    :return: list of all magnitudes of the signals dispersed in directions of 0.360 degrees with applied quantization.
+    :return: array of complex responses in directions of 0..360 degrees with applied quantization.
     """
-    ro = 2 * np.pi * frequency
-    result = []
-    tmcmi = quantize_tmi(cma_tmi(radius, M, phi, theta, c), sf)
     degrees_resolution = np.linspace(0, 360, resolution)
     # Calculate H_DSB according to formula 1.4
-    for phi_s in degrees_resolution:
-        kj = cma_tmi(radius, M, phi_s, theta, c)
-        sum = 0
-        for index in range(0, M):
-            sum += np.exp(1j * ro * (tmcmi[index] - kj[index]))
-        result.append(sum / M)
-    return result
\ No newline at end of file
+    return cma_response(theta, phi, degrees_resolution, frequency, M, radius, c, sf=sf)[0, 0]
+
+def cma_beampattern_fractional(theta: float, phi: float, frequency: int, M: int, radius: float, c: int, resolution: int, sf: int, order: int = 3) -> np.ndarray:
+    """
+    This function calculates beam pattern of circular microphone array, whose delays are realized by integer delays
+    and Lagrange fractional delay filters at a given sampling frequency. Returned data are best displayed on polar plot
+    and can be compared with cma_beampattern and cma_beampattern_quantization.
+    :param theta: vertical angle of a sound source
+    :param phi: horizontal angle of a sound source
+    :param frequency: frequency of a beam pattern
+    :param M: number of microphones in circular microphone array
+    :param radius: radius of circular microphone array
+    :param c: speed of sound
+    :param resolution: number of points that should be generated in range of 0..360 degrees
+    :param sf: sampling frequency of the beamformer
+    :param order: order of the Lagrange interpolation
+    :return: array of complex responses in directions of 0..360 degrees with fractional delays.
+    """
+    degrees_resolution = np.linspace(0, 360, resolution)
+    weights = fractional_steering_weights(cma_tmi_matrix(radius, M, phi, theta, c), frequency, sf, order)
+    return cma_response_weighted(theta, weights, degrees_resolution, frequency, M, radius, c)[0, 0]
+
+def delay_and_sum(data: np.ndarray, sample_delays, fractional_order: int = None, dtype=np.float64) -> np.ndarray:
+    """
+    Applies delay-and-sum beamformer to a whole multichannel recording. Output is longer than the input by the highest
+    delay, so no samples of any channel are lost. Block processing (delay_and_sum_blocks) is checked against this
+    reference by Benchmarks/benchmarks.py.
+    :param data: recording of shape (samples, M) with microphones in the correct order
+    :param sample_delays: delays in samples, whole numbers unless fractional_order is given
+    :param fractional_order: order of Lagrange fractional delay filters, None for integer delays
+    :param dtype: data type of the output and of the summation
+    :return: mono signal
+    """
+    if fractional_order is None:
+        integer_delays = np.asarray(sample_delays, dtype=int)
+        taps = np.ones((integer_delays.size, 1))
+    else:
+        integer_delays, taps, _ = lagrange_fractional_delay(sample_delays, fractional_order)
+    samples, M = data.shape
+    data = data.astype(dtype, copy=False)
+    taps = taps.astype(dtype)
+    offsets = integer_delays[:, np.newaxis] + np.arange(taps.shape[1])
+    result = np.zeros(samples + offsets.max(), dtype=dtype)
+    # Channels (and filter taps) sharing the same delay are summed together, so the loop runs over distinct delays
+    # and not over microphones
+    for offset in np.unique(offsets):
+        channels, tap_indices = np.nonzero(offsets == offset)
+        result[offset:offset + samples] += data[:, channels] @ taps[channels, tap_indices]
+    return result / M
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Block based delay-and-sum beamformer used by the real-time script. All buffers are allocated once when the processor
+is created, so processing of a block does not allocate any new arrays.
+
+Steering (delays, gain and channel map) can be changed while a stream is running. New steering is prepared in the
+thread which asks for it, or taken from precomputed presets, and the callback only swaps it at the start of the next
+block and crossfades the output of the old and the new steering.
+"""
+import numpy as np
+from ComputationFunctions import ComputationFunctions as cf
+
+
+class Steering:
+    """
+    Everything the processor needs to delay and sum a block: gather index of every delayed sample in the ring buffer
+    for every position of the current block and weights of every gathered sample. Steering is never modified after it
+    is prepared, so it can be handed over between threads by a plain assignment.
+    """
+    def __init__(self, sample_delays: np.ndarray, taps: np.ndarray, gain: float, channel_order: np.ndarray,
+                 gather_index: np.ndarray, weights: np.ndarray):
+        self.sample_delays = sample_delays
+        self.taps = taps
+        self.gain = gain
+        self.channel_order = channel_order
+        self.gather_index = gather_index
+        self.weights = weights
+
+
+class DelayAndSumProcessor:
+    """
+    Delays all channels and sums them into a mono signal. Input blocks are written into a per-channel ring buffer which
+    holds the current block together with enough history for the highest delay. Delayed samples of all channels are
+    then read from the ring buffer by one precomputed gather index, therefore delays longer than one block are
+    supported as well. Delays are whole numbers of samples, or fractional delays realized by Lagrange interpolation
+    filters when fractional_order is given.
+
+    Several beams can be formed from the same input in one pass by passing delays of shape (beams, M). All beams share
+    the buffer and the output then has shape (blocksize, beams).
+    """
+    def __init__(self, sample_delays: list, blocksize: int, channels_in: int = None, channel_order: list = None,
+                 gain: float = 1, fractional_order: int = None, max_delay: float = None, crossfade: int = None,
+                 dtype=np.float64):
+        """
+        :param sample_delays: delays in samples of shape (M,) or (beams, M), where last index matches microphone number
+        :param blocksize: number of frames in every processed block
+        :param channels_in: number of channels of the input blocks, number of microphones by default
+        :param channel_order: input channel of every microphone, e.g. (4, 0, 5, 1, 6, 2, 7, 3); identity by default
+        :param gain: gain applied to the summed signal
+        :param fractional_order: order of Lagrange fractional delay filters, None for integer delays
+        :param max_delay: highest delay in samples the processor can be steered to later, highest of sample_delays
+                          by default
+        :param crossfade: number of samples over which the output fades from the old to the new steering, at most
+                          blocksize, blocksize by default, 0 to switch immediately
+        :param dtype: data type of the buffer, weights and output, float32 halves the memory traffic of every block
+        """
+        sample_delays = np.asarray(sample_delays)
+        self.single_beam = sample_delays.ndim == 1
+        self.beams, self.M = np.atleast_2d(sample_delays).shape
+        self.blocksize = blocksize
+        self.channels_in = self.M if channels_in is None else channels_in
+        self.dtype = np.dtype(dtype)
+        self.fractional_order = fractional_order
+        self.filter_length = 1 if fractional_order is None else fractional_order + 1
+        self.presets = {}
+
+        # History is the number of samples before the current block needed by the highest delay. Ring buffer length
+        # is a multiple of the block size, so a block is always written without wrapping around
+        max_delay = sample_delays.max() if max_delay is None else max(max_delay, sample_delays.max())
+        self.history = int(np.ceil(max_delay)) + self.filter_length - 1
+        self.blocks_in_buffer = -(-(self.history + blocksize) // blocksize)
+        self.buffer = np.zeros((self.blocks_in_buffer * blocksize, self.channels_in), dtype=dtype)
+        self._flat_buffer = self.buffer.reshape(-1)
+        self._block_index = 0
+
+        # The steering is swapped at the start of a block, so the whole crossfade has to fit into that block
+        crossfade = blocksize if crossfade is None else crossfade
+        if not 0 <= crossfade <= blocksize:
+            raise ValueError(f"Crossfade has to be between 0 and blocksize ({blocksize}) samples")
+        self._fade_in = np.minimum(np.arange(1, blocksize + 1) / max(crossfade, 1), 1)[:, np.newaxis].astype(dtype)
+        self._fade_out = 1 - self._fade_in
+        self._delayed = np.empty((self.beams, blocksize, self.M * self.filter_length), dtype=dtype)
+        self._summed = np.empty((self.beams, blocksize, 1), dtype=dtype)
+        self._fading = np.empty((self.beams, blocksize, 1), dtype=dtype)
+        self.output = self._summed[0, :, 0] if self.single_beam else self._summed[:, :, 0].T
+
+        default_order = np.arange(self.M) if channel_order is None else channel_order
+        self._active = self.prepare(sample_delays, gain, default_order)
+        self._requested = self._active
+
+    @classmethod
+    def from_geometry(cls, geometry: cf.ArrayGeometry, phi_angles, theta: float, c: float, sf: int, blocksize: int,
+                      channels_in: int = None, gain: float = 1, fractional_order: int = None,
+                      max_delay: float = None, crossfade: int = None, dtype=np.float64) -> "DelayAndSumProcessor":
+        """
+        Creates processor steered to given horizontal angles, channel order is taken from the channel map of the
+        geometry.
+        :param geometry: geometry of the microphone array
+        :param phi_angles: horizontal angle, or array of angles for several beams, in degrees
+        :param theta: vertical angle in degrees
+        :param c: speed of sound
+        :param sf: sampling frequency in Hz
+        :param blocksize: number of frames in every processed block
+        :param channels_in: number of channels of the input blocks, number of microphones by default
+        :param gain: gain applied to the summed signal
+        :param fractional_order: order of Lagrange fractional delay filters, None for integer delays
+        :param max_delay: highest delay in samples the processor can be steered to later
+        :param crossfade: number of samples of the crossfade when steering changes, blocksize by default
+        :param dtype: data type of the buffer, weights and output
+        :return: delay-and-sum processor
+        """
+        sample_delays = cf.array_sample_delays(geometry, phi_angles, theta, c, sf, fractional_order is not None)
+        return cls(sample_delays, blocksize, channels_in, geometry.channel_map, gain, fractional_order, max_delay,
+                   crossfade, dtype)
+
+    @property
+    def sample_delays(self) -> np.ndarray:
+        """ Integer delays of the active steering of shape (beams, M) """
+        return self._active.sample_delays
+
+    @property
+    def taps(self) -> np.ndarray:
+        """ Filter taps of the active steering of shape (beams, M, filter length) """
+        return self._active.taps
+
+    @property
+    def gain(self) -> float:
+        """ Gain of the active steering """
+        return self._active.gain
+
+    @property
+    def channel_order(self) -> np.ndarray:
+        """ Input channel of every microphone of the active steering """
+        return self._active.channel_order
+
+    def prepare(self, sample_delays=None, gain: float = None, channel_order: list = None) -> Steering:
+        """
+        Calculates gather index and weights of a steering. Allocates memory, so it should be called outside of the
+        stream callback, e.g. when presets are created or from a control thread.
+        :param sample_delays: delays in samples of shape (M,) or (beams, M), not higher than max_delay; delays of the
+                              requested steering by default
+        :param gain: gain applied to the summed signal, gain of the requested steering by default
+        :param channel_order: input channel of every microphone, channel order of the requested steering by default
+        :return: steering which can be passed to apply or stored as a preset
+        """
+        requested = getattr(self, "_requested", None)
+        if sample_delays is None:
+            sample_delays, taps = requested.sample_delays, requested.taps
+        else:
+            sample_delays = np.atleast_2d(np.asarray(sample_delays))
+            if sample_delays.shape != (self.beams, self.M):
+                raise ValueError(f"Delays have to be of shape {(self.beams, self.M)}")
+            if sample_delays.min() < 0:
+                raise ValueError("Delays have to be non-negative")
+            if self.fractional_order is None:
+                sample_delays, taps = sample_delays.astype(int), np.ones(sample_delays.shape + (1,))
+            else:
+                sample_delays, taps, _ = cf.lagrange_fractional_delay(sample_delays, self.fractional_order)
+            if sample_delays.max() + self.filter_length - 1 > self.history:
+                raise ValueError("Delays are higher than max_delay given when the processor was created")
+        gain = requested.gain if gain is None else gain
+        if channel_order is None:
+            channel_order = requested.channel_order
+        else:
+            channel_order = np.asarray(channel_order, dtype=int)
+            if channel_order.shape != (self.M,):
+                raise ValueError(f"Channel order has to contain one input channel for each of {self.M} microphones")
+            if channel_order.min() < 0 or channel_order.max() >= self.channels_in:
+                raise ValueError(f"Input channels have to be between 0 and {self.channels_in - 1}")
+
+        # Gather index of every delayed sample (and filter tap) for every position of the current block in the ring
+        # buffer, of shape (blocks in buffer, beams, frames, microphones * taps)
+        frames = np.arange(self.blocksize)[:, np.newaxis, np.newaxis]
+        offsets = sample_delays[:, np.newaxis, :, np.newaxis] + np.arange(self.filter_length)
+        starts = np.arange(self.blocks_in_buffer)[:, np.newaxis, np.newaxis, np.newaxis, np.newaxis] * self.blocksize
+        rows = ((starts + frames - offsets) % self.buffer.shape[0]).reshape(self.blocks_in_buffer, self.beams,
+                                                                            self.blocksize, -1)
+        gather_index = rows * self.channels_in + np.repeat(channel_order, self.filter_length)
+        weights = (taps * gain / self.M).reshape(self.beams, -1, 1).astype(self.dtype)
+        return Steering(sample_delays, taps, gain, channel_order, gather_index, weights)
+
+    def apply(self, steering: Steering):
+        """
+        Requests a prepared steering. Can be called from any thread, the steering is swapped at the start of the next
+        block and the output is crossfaded from the old steering. When several steerings are requested during one
+        block, only the last one is used.
+        :param steering: steering returned by prepare
+        """
+        self._requested = steering
+
+    def steer(self, sample_delays=None, gain: float = None, channel_order: list = None):
+        """
+        Prepares and requests a new steering, see prepare and apply. Unchanged parameters are kept.
+        :param sample_delays: delays in samples of shape (M,) or (beams, M), not higher than max_delay
+        :param gain: gain applied to the summed signal
+        :param channel_order: input channel of every microphone
+        """
+        self.apply(self.prepare(sample_delays, gain, channel_order))
+
+    def add_preset(self, name, sample_delays=None, gain: float = None, channel_order: list = None):
+        """
+        Prepares a steering once and stores it under a name, switching to it by select costs no computation.
+        :param name: any hashable name of the preset, e.g. horizontal angle in degrees
+        :param sample_delays: delays in samples of shape (M,) or (beams, M), not higher than max_delay
+        :param gain: gain applied to the summed signal
+        :param channel_order: input channel of every microphone
+        """
+        self.presets[name] = self.prepare(sample_delays, gain, channel_order)
+
+    def select(self, name):
+        """ Requests a steering stored by add_preset, can be called from any thread """
+        self.apply(self.presets[name])
+
+    def process(self, indata: np.ndarray, outdata: np.ndarray = None) -> np.ndarray:
+        """
+        Delays and sums one block of input data. The result is written to outdata (if given) and to the output
+        attribute, which is overwritten by the next block. Single beam is written to every channel of outdata,
+        multiple beams need one channel of outdata per beam.
+        :param indata: input block of shape (blocksize, channels_in)
+        :param outdata: output block of shape (blocksize, output channels)
+        :return: summed signal of the block of shape (blocksize,) or (blocksize, beams)
+        """
+        requested = self._requested
+        start = self._block_index * self.blocksize
+        self.buffer[start:start + self.blocksize] = indata
+        self._delay_and_sum(self._active, self._summed)
+        if requested is not self._active:
+            self._delay_and_sum(requested, self._fading)
+            self._summed *= self._fade_out
+            self._fading *= self._fade_in
+            self._summed += self._fading
+            self._active = requested
+        if outdata is not None:
+            outdata[:] = self.output[:, np.newaxis] if self.single_beam else self.output
+        self._block_index = (self._block_index + 1) % self.blocks_in_buffer
+        return self.output
+
+    def _delay_and_sum(self, steering: Steering, out: np.ndarray):
+        # Indices are always valid, any mode other than 'raise' lets numpy write into out without a temporary copy
+        np.take(self._flat_buffer, steering.gather_index[self._block_index], out=self._delayed, mode='clip')
+        np.matmul(self._delayed, steering.weights, out=out)
+
+    def reset(self):
+        """ Clears history of the ring buffer """
+        self.buffer.fill(0)
+        self._block_index = 0
@@ -0,0 +1,111 @@
+"""
+Direction of arrival estimation by steered response power (SRP). Power of the delay-and-sum output steered to a
+direction equals, up to a constant, the sum of cross-correlations of all microphone pairs taken at the time difference
+of arrival of that direction. Cross-correlations are calculated by one FFT of every channel and one inverse FFT of every
+pair, so scanning many directions costs only a table lookup per direction and pair. With PHAT weighting the spectra are
+whitened first, which sharpens the peaks in reverberant rooms.
+"""
+import numpy as np
+from ComputationFunctions import ComputationFunctions as cf
+
+
+class SrpScanner:
+    """
+    Streaming SRP (or SRP-PHAT) scanner. Every block gives power of all scanned directions in the power attribute and
+    the direction with the highest power in the peak attribute. Lookup table of every direction and microphone pair
+    and all buffers used between the FFTs are prepared once when the scanner is created.
+    """
+    def __init__(self, delays, azimuths, sf: int, blocksize: int, channels_in: int = None, channel_order: list = None,
+                 phat: bool = True, band: tuple = (200, 8000), interpolation: int = 4, fft_size: int = None,
+                 smoothing: float = 0, dtype=np.float64):
+        """
+        :param delays: delays in seconds of shape (directions, M), e.g. from ArrayGeometry.delays
+        :param azimuths: horizontal angle of every direction in degrees
+        :param sf: sampling frequency in Hz
+        :param blocksize: number of frames in every processed block
+        :param channels_in: number of channels of the input blocks, M by default
+        :param channel_order: input channel of every microphone; identity by default
+        :param phat: use PHAT weighting (SRP-PHAT) instead of plain SRP
+        :param band: lowest and highest frequency in Hz used for the scan
+        :param interpolation: upsampling of the cross-correlations, time differences are rounded to
+                              1 / (sf * interpolation)
+        :param fft_size: length of the FFT, 2 * blocksize by default
+        :param smoothing: forgetting factor of exponential averaging of the power over blocks, 0 for no averaging
+        :param dtype: real data type of the FFTs and of the power, float32 halves the memory traffic
+        """
+        delays = np.atleast_2d(np.asarray(delays, dtype=float))
+        self.azimuths = np.asarray(azimuths, dtype=float)
+        self.directions, self.M = delays.shape
+        self.sf = sf
+        self.blocksize = blocksize
+        self.channels_in = self.M if channels_in is None else channels_in
+        self.channel_order = np.arange(self.M) if channel_order is None else np.asarray(channel_order, dtype=int)
+        self.phat = phat
+        self.smoothing = smoothing
+        self.dtype = np.dtype(dtype)
+        self.fft_size = 2 * blocksize if fft_size is None else fft_size
+        self.correlation_size = self.fft_size * interpolation
+
+        # Channel x_j delayed by delays[j] is aligned with x_i delayed by delays[i], so the cross-correlation
+        # sum_t x_i(t + l) * x_j(t) of the pair peaks at the lag l = delays[j] - delays[i]
+        self.pairs = np.array([(i, j) for i in range(self.M) for j in range(i + 1, self.M)])
+        lags = np.rint((delays[:, self.pairs[:, 1]] - delays[:, self.pairs[:, 0]]) * sf * interpolation).astype(int)
+        self._lookup = (lags % self.correlation_size) * len(self.pairs) + np.arange(len(self.pairs))
+
+        frequencies = np.fft.rfftfreq(self.fft_size, 1 / sf)
+        self._band = slice(*np.searchsorted(frequencies, band))
+        self._cross = np.zeros((self.correlation_size // 2 + 1, len(self.pairs)), dtype=cf.complex_dtype(dtype))
+        self._pair_power = np.empty((self.directions, len(self.pairs)), dtype=dtype)
+        self.power = np.zeros(self.directions, dtype=dtype)
+        self.peak = 0
+
+    @classmethod
+    def from_geometry(cls, geometry: cf.ArrayGeometry, azimuths, theta: float, c: float, sf: int, blocksize: int,
+                      channels_in: int = None, phat: bool = True, band: tuple = (200, 8000),
+                      interpolation: int = 4, smoothing: float = 0, dtype=np.float64) -> "SrpScanner":
+        """
+        Creates scanner of given horizontal angles, channel order is taken from the channel map of the geometry.
+        :param geometry: geometry of the microphone array
+        :param azimuths: horizontal angles of the scanned directions in degrees, e.g. np.arange(360)
+        :param theta: vertical angle in degrees
+        :param c: speed of sound
+        :param sf: sampling frequency in Hz
+        :param blocksize: number of frames in every processed block
+        :param channels_in: number of channels of the input blocks, M by default
+        :param phat: use PHAT weighting (SRP-PHAT) instead of plain SRP
+        :param band: lowest and highest frequency in Hz used for the scan
+        :param interpolation: upsampling of the cross-correlations
+        :param smoothing: forgetting factor of exponential averaging of the power over blocks
+        :param dtype: real data type of the FFTs and of the power
+        :return: SRP scanner
+        """
+        return cls(geometry.delays(azimuths, theta, c), azimuths, sf, blocksize, channels_in, geometry.channel_map,
+                   phat, band, interpolation, smoothing=smoothing, dtype=dtype)
+
+    def process(self, block: np.ndarray) -> float:
+        """
+        Scans all directions in one block of input data. Power of all directions is written to the power attribute,
+        which is overwritten by the next block. Unlike DelayAndSumProcessor.process, the scan allocates the selected
+        channels, their spectra and the correlations (numpy FFT has no out= argument) in every block.
+        :param block: input block of shape (blocksize, channels_in)
+        :return: horizontal angle with the highest power in degrees
+        """
+        channels = np.asarray(block[:, self.channel_order], dtype=self.dtype)
+        spectra = np.fft.rfft(channels, n=self.fft_size, axis=0)[self._band]
+        if self.phat:
+            spectra /= np.maximum(np.abs(spectra), np.finfo(self.dtype).tiny)
+        np.multiply(spectra[:, self.pairs[:, 0]], spectra[:, self.pairs[:, 1]].conj(), out=self._cross[self._band])
+        correlations = np.fft.irfft(self._cross, n=self.correlation_size, axis=0)
+        np.take(correlations, self._lookup, out=self._pair_power)
+        if self.smoothing:
+            self.power *= self.smoothing
+            self.power += (1 - self.smoothing) * self._pair_power.sum(axis=1)
+        else:
+            self._pair_power.sum(axis=1, out=self.power)
+        self.peak = int(self.power.argmax())
+        return self.azimuths[self.peak]
+
+    def reset(self):
+        """ Clears averaged power """
+        self.power.fill(0)
+        self.peak = 0
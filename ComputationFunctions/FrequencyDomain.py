@@ -0,0 +1,357 @@
+"""
+Beamforming in frequency domain. Multichannel signals are split into Hann windowed frames, every frame of every channel
+is transformed by one real FFT and the spectra are combined with complex per-bin weights. Output frames are put back
+together by overlap-add. Steering by phase shifts is exact also for delays which are not whole samples, and one FFT of
+every channel serves any number of beams.
+
+Besides fixed delay-and-sum weights, the weights can be calculated by MVDR (minimum variance distortionless response)
+from a noise covariance matrix of every bin. Covariance of spherically diffuse noise gives superdirective beamformer,
+whose directivity at low frequencies is much higher than the one of delay-and-sum, and covariance estimated from the
+input gives adaptive beamformer which suppresses interfering sources.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from ComputationFunctions import ComputationFunctions as cf
+
+
+def delay_and_sum_weights(delays, frequencies, dtype=np.float64) -> np.ndarray:
+    """
+    Calculates per-bin weights of delay-and-sum beamformer, delaying channel m by delays[m] is a phase shift of
+    exp(-j * ro * delays[m]).
+    :param delays: delays in seconds of shape (beams, M), e.g. from cma_tmi_matrix
+    :param frequencies: frequencies of the bins in Hz
+    :param dtype: real data type whose complex counterpart is returned, phases are calculated in float64
+    :return: complex weights of shape (bins, beams, M)
+    """
+    delays = np.atleast_2d(np.asarray(delays, dtype=float))
+    ro = 2 * np.pi * np.asarray(frequencies, dtype=float)[:, np.newaxis, np.newaxis]
+    weights = np.exp(-1j * ro * delays[np.newaxis, :, :]) / delays.shape[1]
+    return weights.astype(cf.complex_dtype(dtype), copy=False)
+
+def steering_vectors(delays, frequencies, dtype=np.float64) -> np.ndarray:
+    """
+    Calculates steering vectors of directions given by their delay-and-sum delays. Signal of a direction is aligned by
+    delaying channel m by delays[m], so its phase on channel m is exp(j * ro * delays[m]) up to a common phase.
+    :param delays: delays in seconds of shape (beams, M), e.g. from cma_tmi_matrix
+    :param frequencies: frequencies of the bins in Hz
+    :param dtype: real data type whose complex counterpart is returned
+    :return: complex steering vectors of shape (bins, beams, M)
+    """
+    delays = np.atleast_2d(np.asarray(delays, dtype=float))
+    ro = 2 * np.pi * np.asarray(frequencies, dtype=float)[:, np.newaxis, np.newaxis]
+    return np.exp(1j * ro * delays[np.newaxis, :, :]).astype(cf.complex_dtype(dtype), copy=False)
+
+def diffuse_coherence(geometry: cf.ArrayGeometry, frequencies, c: float) -> np.ndarray:
+    """
+    Calculates coherence of spherically diffuse noise between all pairs of microphones, sin(ro * d / c) / (ro * d / c)
+    for microphones d meters apart.
+    :param geometry: geometry of the microphone array
+    :param frequencies: frequencies of the bins in Hz
+    :param c: speed of sound
+    :return: real coherence matrices of shape (bins, M, M)
+    """
+    distances = np.linalg.norm(geometry.positions[:, np.newaxis, :] - geometry.positions[np.newaxis, :, :], axis=-1)
+    return np.sinc(2 * np.asarray(frequencies, dtype=float)[:, np.newaxis, np.newaxis] * distances / c)
+
+def mvdr_weights(covariance: np.ndarray, steering: np.ndarray, loading: float = 1e-2,
+                 dtype=np.float64) -> np.ndarray:
+    """
+    Calculates MVDR weights conj(R^-1 a / (a^H R^-1 a)) of all bins and beams by one batched solve. Covariance is
+    diagonally loaded by loading times its mean diagonal, which limits the noise amplification of the weights. Bins
+    with zero covariance get delay-and-sum weights.
+    :param covariance: noise covariance matrices of shape (bins, M, M)
+    :param steering: steering vectors of shape (bins, beams, M), see steering_vectors
+    :param loading: diagonal loading relative to the mean diagonal of the covariance, has to be positive
+    :param dtype: real data type whose complex counterpart is returned, the solve is done in complex128
+    :return: complex weights of shape (bins, beams, M) applied to the spectra like delay_and_sum_weights
+    """
+    M = steering.shape[-1]
+    level = np.trace(covariance, axis1=-2, axis2=-1).real / M
+    level = np.where(level > 0, level, 1)
+    loaded = covariance.astype(complex)
+    loaded.reshape(loaded.shape[0], -1)[:, ::M + 1] += (loading * level)[:, np.newaxis]
+    steering = steering.astype(complex, copy=False)
+    solved = np.linalg.solve(loaded, steering.transpose(0, 2, 1))
+    gain = np.einsum('fbm,fmb->fb', steering.conj(), solved)
+    weights = (solved / gain[:, np.newaxis, :]).conj().transpose(0, 2, 1)
+    return weights.astype(cf.complex_dtype(dtype))
+
+def superdirective_weights(geometry: cf.ArrayGeometry, phi_angles, theta: float, c: float, frequencies,
+                           loading: float = 1e-2, dtype=np.float64) -> np.ndarray:
+    """
+    Calculates weights of superdirective beamformer, i.e. MVDR weights for spherically diffuse noise.
+    :param geometry: geometry of the microphone array
+    :param phi_angles: horizontal angle, or array of angles for several beams, in degrees
+    :param theta: vertical angle in degrees
+    :param c: speed of sound
+    :param frequencies: frequencies of the bins in Hz
+    :param loading: diagonal loading of the coherence matrices, lower values give higher directivity at low
+                    frequencies but amplify uncorrelated noise of the microphones
+    :param dtype: real data type whose complex counterpart is returned
+    :return: complex weights of shape (bins, beams, M)
+    """
+    steering = steering_vectors(geometry.delays(phi_angles, theta, c), frequencies)
+    return mvdr_weights(diffuse_coherence(geometry, frequencies, c), steering, loading, dtype)
+
+def weights_response(geometry: cf.ArrayGeometry, theta: float, weights: np.ndarray, look_phi, frequencies, c: float,
+                     dtype=np.float64) -> np.ndarray:
+    """
+    Calculates beam pattern of per-bin weights, e.g. weights of StftBeamformer or MvdrBeamformer, by
+    ComputationFunctions.array_response_weighted. Delay-and-sum weights give the same response as array_response.
+    :param geometry: geometry of the microphone array
+    :param theta: vertical angle of a sound source
+    :param weights: complex weights of shape (frequencies, beams, M)
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequencies of the rows of weights in Hz
+    :param c: speed of sound
+    :param dtype: real data type of the calculation
+    :return: complex array of shape (frequencies, beams, look angles)
+    """
+    # array_response_weighted models the phase of a microphone by the opposite sign, so the weights are conjugated
+    return cf.array_response_weighted(geometry, theta, np.conj(weights), look_phi, frequencies, c, dtype=dtype)
+
+def superdirective_response(geometry: cf.ArrayGeometry, theta: float, steering_phi, look_phi, frequencies, c: float,
+                            loading: float = 1e-2, dtype=np.float64) -> np.ndarray:
+    """
+    Calculates beam pattern of superdirective beamformer, counterpart of ComputationFunctions.array_response.
+    :param geometry: geometry of the microphone array
+    :param theta: vertical angle of a sound source
+    :param steering_phi: horizontal angle or array of horizontal angles the array is steered to
+    :param look_phi: horizontal angle or array of horizontal angles the response is evaluated at
+    :param frequencies: frequency or array of frequencies in Hz
+    :param c: speed of sound
+    :param loading: diagonal loading of the coherence matrices
+    :param dtype: real data type of the calculation
+    :return: complex array of shape (frequencies, steering angles, look angles)
+    """
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    weights = superdirective_weights(geometry, steering_phi, theta, c, frequencies, loading)
+    return weights_response(geometry, theta, weights, look_phi, frequencies, c, dtype)
+
+
+class StftBeamformer:
+    """
+    Streaming frequency domain beamformer. Input of arbitrary length is processed chunk by chunk, frames which are not
+    complete yet are kept for the next chunk. Frames of frame_length samples with hop of frame_length / 2 are windowed
+    by periodic Hann window (which sums up to one) and zero padded to fft_size samples, so delays up to
+    fft_size - frame_length samples do not wrap around the frame. Output is delayed by latency samples.
+    """
+    def __init__(self, delays, sf: int, frame_length: int = 256, fft_size: int = None, channels_in: int = None,
+                 channel_order: list = None, dtype=np.float64):
+        """
+        :param delays: delays in seconds of shape (beams, M) or (M,) for a single beam, e.g. from cma_tmi_matrix
+        :param sf: sampling frequency in Hz
+        :param frame_length: number of samples in one frame, has to be even
+        :param fft_size: length of the FFT, 2 * frame_length by default, has to be a multiple of frame_length / 2
+        :param channels_in: number of channels of the input chunks, M by default
+        :param channel_order: input channel of every microphone; identity by default
+        :param dtype: real data type of the frames and of the output, float32 makes the spectra complex64
+        """
+        delays = np.atleast_2d(np.asarray(delays, dtype=float))
+        self.beams, self.M = delays.shape
+        self.sf = sf
+        self.dtype = np.dtype(dtype)
+        self.frame_length = frame_length
+        self.hop = frame_length // 2
+        self.fft_size = 2 * frame_length if fft_size is None else fft_size
+        if frame_length % 2 or self.fft_size % self.hop:
+            raise ValueError("frame_length has to be even and fft_size a multiple of frame_length / 2")
+        if delays.max() * sf > self.fft_size - frame_length:
+            raise ValueError("Delays have to be shorter than fft_size - frame_length samples")
+        self.channels_in = self.M if channels_in is None else channels_in
+        self.channel_order = np.arange(self.M) if channel_order is None else np.asarray(channel_order, dtype=int)
+        self.latency = frame_length - self.hop
+
+        self.frequencies = np.fft.rfftfreq(self.fft_size, 1 / sf)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame_length) / frame_length)).astype(dtype)
+        self.weights = delay_and_sum_weights(delays, self.frequencies, dtype)
+        self.reset()
+
+    @classmethod
+    def from_geometry(cls, geometry: cf.ArrayGeometry, phi_angles, theta: float, c: float, sf: int,
+                      frame_length: int = 256, fft_size: int = None, channels_in: int = None,
+                      dtype=np.float64) -> "StftBeamformer":
+        """
+        Creates beamformer steered to given horizontal angles, channel order is taken from the channel map of the
+        geometry.
+        :param geometry: geometry of the microphone array
+        :param phi_angles: horizontal angle, or array of angles for several beams, in degrees
+        :param theta: vertical angle in degrees
+        :param c: speed of sound
+        :param sf: sampling frequency in Hz
+        :param frame_length: number of samples in one frame, has to be even
+        :param fft_size: length of the FFT, 2 * frame_length by default
+        :param channels_in: number of channels of the input chunks, M by default
+        :param dtype: real data type of the frames and of the output
+        :return: frequency domain beamformer
+        """
+        return cls(geometry.delays(phi_angles, theta, c), sf, frame_length, fft_size, channels_in,
+                   geometry.channel_map, dtype)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Beamforms one chunk of input data of any length.
+        :param block: input chunk of shape (samples, channels_in)
+        :return: output of shape (samples, beams), number of returned samples is a multiple of the hop
+        """
+        data = np.concatenate((self._pending, block[:, self.channel_order]), dtype=self.dtype, casting='same_kind')
+        n_frames = max(0, (data.shape[0] - self.frame_length) // self.hop + 1)
+        if n_frames == 0:
+            self._pending = data
+            return np.empty((0, self.beams), dtype=self.dtype)
+
+        frames = sliding_window_view(data, self.frame_length, axis=0)[::self.hop][:n_frames]
+        spectra = self.spectra(frames)
+        self.update(spectra)
+        output_frames = np.fft.irfft(self.weights @ spectra.transpose(2, 1, 0), n=self.fft_size, axis=0)
+
+        # Overlap-add, segment r of frame f belongs to the output hop f + r
+        segments = self.fft_size // self.hop
+        output = np.zeros(((n_frames + segments - 1) * self.hop, self.beams), dtype=self.dtype)
+        output[:self._tail.shape[0]] += self._tail
+        output_frames = output_frames.reshape(segments, self.hop, self.beams, n_frames)
+        for r in range(segments):
+            output[r * self.hop:(r + n_frames) * self.hop] += \
+                output_frames[r].transpose(2, 0, 1).reshape(n_frames * self.hop, self.beams)
+
+        self._tail = output[n_frames * self.hop:].copy()
+        self._pending = data[n_frames * self.hop:].copy()
+        return output[:n_frames * self.hop]
+
+    def update(self, spectra: np.ndarray):
+        """
+        Called with spectra of every chunk before they are weighted, weights of delay-and-sum beamformer are fixed.
+        :param spectra: spectra of shape (frames, M, bins)
+        """
+
+    def spectra(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Windows and transforms frames of all channels.
+        :param frames: frames of shape (frames, M, frame_length)
+        :return: spectra of shape (frames, M, bins)
+        """
+        return np.fft.rfft(frames * self.window, n=self.fft_size, axis=-1)
+
+    def flush(self) -> np.ndarray:
+        """ Returns remaining output of all samples given so far, processor is reset afterwards """
+        output = self.process(np.zeros((self.fft_size, self.channels_in), dtype=self.dtype))
+        self.reset()
+        return output
+
+    def reset(self):
+        """ Clears history of the input and the overlap-add tail """
+        self._pending = np.zeros((self.frame_length - self.hop, self.M), dtype=self.dtype)
+        self._tail = np.zeros((self.fft_size - self.hop, self.beams), dtype=self.dtype)
+
+
+class MvdrBeamformer(StftBeamformer):
+    """
+    Streaming MVDR beamformer. Covariance of every bin is updated recursively by every frame,
+    R = forgetting * R + (1 - forgetting) * x x^H, and weights are solved for many bins at once. Every chunk solves
+    every update_interval-th bin, so the weights of a bin are reused by update_interval chunks and the cost of the
+    solves is spread evenly over the chunks. Until the first solve the weights are those of the initial covariance,
+    delay-and-sum weights when no covariance is given. With adapt set to False the weights are frozen, so
+    superdirective beamformer created by superdirective costs the same as delay-and-sum.
+    """
+    def __init__(self, delays, sf: int, frame_length: int = 256, fft_size: int = None, channels_in: int = None,
+                 channel_order: list = None, forgetting: float = 0.98, loading: float = 1e-2,
+                 update_interval: int = 1, covariance: np.ndarray = None, adapt: bool = True, dtype=np.float64):
+        """
+        :param delays: delays in seconds of shape (beams, M) or (M,) for a single beam, e.g. from cma_tmi_matrix
+        :param sf: sampling frequency in Hz
+        :param frame_length: number of samples in one frame, has to be even
+        :param fft_size: length of the FFT, 2 * frame_length by default, has to be a multiple of frame_length / 2
+        :param channels_in: number of channels of the input chunks, M by default
+        :param channel_order: input channel of every microphone; identity by default
+        :param forgetting: forgetting factor of the covariance per frame, closer to 1 averages longer
+        :param loading: diagonal loading relative to the mean diagonal of the covariance, see mvdr_weights
+        :param update_interval: number of chunks in which the weights of all bins are solved once
+        :param covariance: initial covariance of shape (bins, M, M), e.g. from diffuse_coherence; zeros by default
+        :param adapt: update the covariance and the weights by the input
+        :param dtype: real data type of the frames, of the covariance and of the output
+        """
+        delays = np.atleast_2d(np.asarray(delays, dtype=float))
+        M = delays.shape[1]
+        frequencies = np.fft.rfftfreq(2 * frame_length if fft_size is None else fft_size, 1 / sf)
+        self.forgetting = forgetting
+        self.loading = loading
+        self.update_interval = update_interval
+        self.adapt = adapt
+        self.steering = steering_vectors(delays, frequencies, dtype)
+        if covariance is None:
+            covariance = np.zeros((frequencies.size, M, M))
+        self._initial_covariance = np.asarray(covariance).astype(cf.complex_dtype(dtype))
+        self._initial_weights = mvdr_weights(self._initial_covariance, self.steering, loading, dtype)
+        super().__init__(delays, sf, frame_length, fft_size, channels_in, channel_order, dtype)
+
+    @classmethod
+    def from_geometry(cls, geometry: cf.ArrayGeometry, phi_angles, theta: float, c: float, sf: int,
+                      frame_length: int = 256, fft_size: int = None, channels_in: int = None,
+                      forgetting: float = 0.98, loading: float = 1e-2, update_interval: int = 1,
+                      dtype=np.float64) -> "MvdrBeamformer":
+        """
+        Creates adaptive beamformer steered to given horizontal angles, channel order is taken from the channel map of
+        the geometry.
+        :param geometry: geometry of the microphone array
+        :param phi_angles: horizontal angle, or array of angles for several beams, in degrees
+        :param theta: vertical angle in degrees
+        :param c: speed of sound
+        :param sf: sampling frequency in Hz
+        :param frame_length: number of samples in one frame, has to be even
+        :param fft_size: length of the FFT, 2 * frame_length by default
+        :param channels_in: number of channels of the input chunks, M by default
+        :param forgetting: forgetting factor of the covariance per frame
+        :param loading: diagonal loading relative to the mean diagonal of the covariance
+        :param update_interval: number of chunks in which the weights of all bins are solved once
+        :param dtype: real data type of the frames, of the covariance and of the output
+        :return: MVDR beamformer
+        """
+        return cls(geometry.delays(phi_angles, theta, c), sf, frame_length, fft_size, channels_in,
+                   geometry.channel_map, forgetting, loading, update_interval, dtype=dtype)
+
+    @classmethod
+    def superdirective(cls, geometry: cf.ArrayGeometry, phi_angles, theta: float, c: float, sf: int,
+                       frame_length: int = 256, fft_size: int = None, channels_in: int = None,
+                       loading: float = 1e-2, dtype=np.float64) -> "MvdrBeamformer":
+        """
+        Creates superdirective beamformer, whose fixed weights are solved once for spherically diffuse noise.
+        :param geometry: geometry of the microphone array
+        :param phi_angles: horizontal angle, or array of angles for several beams, in degrees
+        :param theta: vertical angle in degrees
+        :param c: speed of sound
+        :param sf: sampling frequency in Hz
+        :param frame_length: number of samples in one frame, has to be even
+        :param fft_size: length of the FFT, 2 * frame_length by default
+        :param channels_in: number of channels of the input chunks, M by default
+        :param loading: diagonal loading of the coherence matrices
+        :param dtype: real data type of the frames and of the output
+        :return: MVDR beamformer with frozen superdirective weights
+        """
+        frequencies = np.fft.rfftfreq(2 * frame_length if fft_size is None else fft_size, 1 / sf)
+        return cls(geometry.delays(phi_angles, theta, c), sf, frame_length, fft_size, channels_in,
+                   geometry.channel_map, loading=loading, covariance=diffuse_coherence(geometry, frequencies, c),
+                   adapt=False, dtype=dtype)
+
+    def update(self, spectra: np.ndarray):
+        """
+        Updates the covariance by all frames of a chunk and solves new weights of every update_interval-th bin.
+        :param spectra: spectra of shape (frames, M, bins)
+        """
+        if not self.adapt:
+            return
+        n_frames = spectra.shape[0]
+        # Frame k of n frames is weighted as if the frames were added one by one
+        frame_weights = (1 - self.forgetting) * self.forgetting ** np.arange(n_frames - 1, -1, -1)
+        channels = spectra.transpose(2, 1, 0)
+        self.covariance *= self.forgetting ** n_frames
+        self.covariance += (channels * frame_weights.astype(self.dtype)) @ channels.conj().transpose(0, 2, 1)
+        bins = slice(self.chunks % self.update_interval, None, self.update_interval)
+        self.weights[bins] = mvdr_weights(self.covariance[bins], self.steering[bins], self.loading, self.dtype)
+        self.chunks += 1
+
+    def reset(self):
+        """ Clears history of the input, the overlap-add tail and the covariance, weights return to the initial ones """
+        super().reset()
+        self.covariance = self._initial_covariance.copy()
+        self.weights = self._initial_weights.copy()
+        self.chunks = 0
@@ -0,0 +1,108 @@
+"""
+Instrumentation of the real-time audio callback. Processing time of every block is stored in a preallocated ring buffer
+and xruns reported by the status argument of the callback are counted. Nothing is logged or allocated inside the
+callback, statistics are calculated and reported from another thread.
+"""
+import time
+import threading
+import numpy as np
+
+# Flags of sounddevice.CallbackFlags which are counted
+STATUS_FLAGS = ("input_underflow", "input_overflow", "output_underflow", "output_overflow", "priming_output")
+
+
+class CallbackMonitor:
+    """
+    Measures processing time of a stream callback and counts xruns. Wrap the callback by monitor.wrap(callback) and
+    call monitor.summary() or start periodic reporting by monitor.start_reporter() outside of the callback.
+    """
+    def __init__(self, blocksize: int, samplerate: int, history: int = 1024):
+        """
+        :param blocksize: number of frames in one block
+        :param samplerate: sampling frequency in Hz
+        :param history: number of last blocks whose processing time is kept
+        """
+        self.budget = blocksize / samplerate
+        self.durations = np.zeros(history)
+        self.blocks = 0
+        self.status_counts = dict.fromkeys(STATUS_FLAGS, 0)
+        self._reporter = None
+        self._stop_reporter = threading.Event()
+
+    def wrap(self, callback):
+        """
+        Returns callback which calls the given callback and records its processing time and status.
+        :param callback: stream callback with arguments (indata, outdata, frames, time, status)
+        :return: instrumented callback with the same arguments
+        """
+        durations = self.durations
+        history = durations.size
+        perf_counter = time.perf_counter
+
+        def instrumented_callback(indata, outdata, frames, time_info, status):
+            start = perf_counter()
+            if status:
+                self.record_status(status)
+            callback(indata, outdata, frames, time_info, status)
+            durations[self.blocks % history] = perf_counter() - start
+            self.blocks += 1
+
+        return instrumented_callback
+
+    def record_status(self, status):
+        """ Counts flags set in sounddevice.CallbackFlags """
+        for flag in STATUS_FLAGS:
+            if getattr(status, flag, False):
+                self.status_counts[flag] += 1
+
+    def summary(self) -> dict:
+        """
+        Calculates statistics of the recorded blocks. Headroom is the part of the block duration which remains after
+        processing of the 99th percentile block.
+        :return: dictionary with number of blocks, processing time percentiles in seconds, headroom and xrun counts
+        """
+        recorded = self.durations[:min(self.blocks, self.durations.size)].copy()
+        result = {"blocks": self.blocks, "budget": self.budget}
+        result.update(self.status_counts)
+        if recorded.size:
+            p99 = float(np.percentile(recorded, 99))
+            result.update({
+                "mean": float(recorded.mean()),
+                "p50": float(np.percentile(recorded, 50)),
+                "p99": p99,
+                "max": float(recorded.max()),
+                "headroom": 1 - p99 / self.budget,
+            })
+        return result
+
+    def report(self) -> str:
+        """ Returns one line summary of the recorded blocks """
+        result = self.summary()
+        xruns = ", ".join(f"{flag} {result[flag]}" for flag in STATUS_FLAGS if result[flag])
+        if "p99" not in result:
+            return "No blocks processed yet"
+        return (f"{result['blocks']} blocks, p50 {result['p50'] * 1e3:.3f} ms, p99 {result['p99'] * 1e3:.3f} ms, "
+                f"max {result['max'] * 1e3:.3f} ms of {self.budget * 1e3:.2f} ms budget "
+                f"(headroom {100 * result['headroom']:.1f} %), xruns: {xruns or 'none'}")
+
+    def start_reporter(self, interval: float = 1.0, output=print):
+        """
+        Starts a thread which reports the summary periodically.
+        :param interval: time between two reports in seconds
+        :param output: function called with the report line
+        """
+        self._stop_reporter.clear()
+
+        def reporter():
+            while not self._stop_reporter.wait(interval):
+                output(self.report())
+
+        self._reporter = threading.Thread(target=reporter, name="CallbackMonitor", daemon=True)
+        self._reporter.start()
+
+    def stop_reporter(self):
+        """ Stops the reporting thread """
+        if self._reporter is not None:
+            self._stop_reporter.set()
+            self._reporter.join()
+            self._reporter = None
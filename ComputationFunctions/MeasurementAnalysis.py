@@ -0,0 +1,52 @@
+"""
+Spectral analysis of processed measurements. Every recording is read only once, block by block, and only DFT bins of
+the requested frequencies are calculated for all frequencies at once. Recordings of all rotation steps then form a
+(angle x frequency) matrix of the measured beam pattern.
+"""
+import os
+import re
+import numpy as np
+from ComputationFunctions.MeasurementProcessing import DEFAULT_BLOCKSIZE, read_blocks, dft_bins
+
+
+def frequency_bins(frequencies, frames: int, samplerate: int) -> np.ndarray:
+    """ Returns indices of DFT bins of length frames in which given frequencies lie """
+    return np.floor(frames * np.asarray(frequencies, dtype=float) / samplerate).astype(np.int64)
+
+def spectral_levels(recording: str, frequencies, blocksize: int = DEFAULT_BLOCKSIZE) -> np.ndarray:
+    """
+    Calculates magnitude spectrum in decibels of a recording with removed DC offset, only at given frequencies.
+    :param recording: path to the recording
+    :param frequencies: frequency or array of frequencies in Hz
+    :param blocksize: number of frames read at once
+    :return: array of shape (frequencies, channels) in dB
+    """
+    import soundfile as sf
+    info = sf.info(recording)
+    bins = frequency_bins(np.atleast_1d(frequencies), info.frames, info.samplerate)
+    # Bin 0 is the sum of all samples, removing DC offset only changes this bin
+    spectrum = dft_bins(read_blocks(recording, blocksize), info.frames, np.concatenate(([0], bins)))
+    spectrum = spectrum[1:] - (bins == 0)[:, np.newaxis] * spectrum[0]
+    with np.errstate(divide='ignore'):
+        return 20 * np.log10(np.abs(spectrum))
+
+def rotation_angle(recording: str, step_angle: float = 1.8) -> float:
+    """ Returns rotation angle of a recording in degrees from its step number, e.g. krok_010.wav -> 18 degrees """
+    return int(re.search(r"(\d+)", os.path.basename(recording)).group(1)) * step_angle
+
+def directivity_matrix(recordings: list, frequencies, step_angle: float = 1.8, normalize: bool = True,
+                       blocksize: int = DEFAULT_BLOCKSIZE) -> tuple:
+    """
+    Calculates measured beam pattern from mono recordings of all rotation steps.
+    :param recordings: paths to the recordings, e.g. from find_recordings
+    :param frequencies: frequency or array of frequencies in Hz
+    :param step_angle: rotation of the array between two steps in degrees
+    :param normalize: normalize maximum of every frequency to 0 dB
+    :param blocksize: number of frames read at once
+    :return: tuple of angles in degrees and array of levels in dB of shape (angles, frequencies)
+    """
+    angles = np.array([rotation_angle(recording, step_angle) for recording in recordings])
+    levels = np.array([spectral_levels(recording, frequencies, blocksize)[:, 0] for recording in recordings])
+    if normalize:
+        levels -= levels.max(axis=0)
+    return angles, levels
@@ -0,0 +1,210 @@
+"""
+Offline processing of measured recordings. Every recording of a measurement directory (one file per rotation step) is
+processed by delay-and-sum beamformer and saved as a mono file. Recordings are processed in parallel by a pool of
+worker processes and files whose output is newer than the recording and was processed with the same parameters are
+skipped, so reruns are incremental. Parameters of every processed file are recorded by a hash in PARAMETERS_FILE of
+the output directory.
+
+Recordings are read in blocks of float32 samples, so peak memory does not depend on the length of a recording.
+"""
+import os
+import glob
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ComputationFunctions.DelayAndSum import DelayAndSumProcessor
+from ComputationFunctions.SurfaceCache import cache_key
+
+# Number of frames read from a recording at once
+DEFAULT_BLOCKSIZE = 16384
+# File of the output directory with the hash of processing parameters of every processed file
+PARAMETERS_FILE = ".processing_parameters.json"
+
+
+def find_recordings(directory: str, pattern: str = "krok_*.wav") -> list:
+    """
+    Finds recordings of a measurement directory.
+    :param directory: measurement directory
+    :param pattern: glob pattern of the recordings
+    :return: sorted list of paths to the recordings
+    """
+    return sorted(glob.glob(os.path.join(directory, pattern)))
+
+def processed_path(recording: str, output_directory: str) -> str:
+    """ Returns path of the processed file of a recording, e.g. krok_000.wav -> krok_000_processed.wav """
+    name, extension = os.path.splitext(os.path.basename(recording))
+    return os.path.join(output_directory, f"{name}_processed{extension}")
+
+def parameters_key(sample_delays, mic_order: list = None, fractional_order: int = None, dtype=np.float64) -> str:
+    """ Returns hash of all parameters the processed file depends on, steering and geometry are given by the delays """
+    return cache_key(function="process_recording", sample_delays=np.asarray(sample_delays, dtype=float),
+                     mic_order=None if mic_order is None else np.asarray(mic_order, dtype=int),
+                     fractional_order=fractional_order, dtype=np.dtype(dtype).str)
+
+def load_parameters(output_directory: str) -> dict:
+    """ Returns parameters key of every processed file of the output directory, empty if none is recorded """
+    try:
+        with open(os.path.join(output_directory, PARAMETERS_FILE)) as parameters_file:
+            return json.load(parameters_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_parameters(output_directory: str, parameters: dict):
+    """ Writes parameters keys of the processed files, a temporary file is replaced so the file is never incomplete """
+    descriptor, temporary = tempfile.mkstemp(suffix=".json", dir=output_directory)
+    with os.fdopen(descriptor, "w") as parameters_file:
+        json.dump(parameters, parameters_file, indent=1, sort_keys=True)
+    os.replace(temporary, os.path.join(output_directory, PARAMETERS_FILE))
+
+def is_up_to_date(recording: str, output: str, key: str = None, parameters: dict = None) -> bool:
+    """
+    Checks whether output exists, is newer than the recording and, if key is given, was processed with the same
+    parameters.
+    :param recording: path to the recording
+    :param output: path of the processed file
+    :param key: parameters key of the current processing, see parameters_key
+    :param parameters: recorded parameters keys of the output directory, see load_parameters
+    :return: True if the recording does not have to be processed again
+    """
+    if not os.path.exists(output) or os.path.getmtime(output) < os.path.getmtime(recording):
+        return False
+    return key is None or (parameters or {}).get(os.path.basename(output)) == key
+
+def read_blocks(recording: str, blocksize: int = DEFAULT_BLOCKSIZE, dtype: str = 'float32'):
+    """
+    Reads a recording block by block.
+    :param recording: path to the recording
+    :param blocksize: number of frames in one block, the last block can be shorter
+    :param dtype: data type of the blocks
+    :return: generator of blocks of shape (frames, channels)
+    """
+    import soundfile as sf
+    yield from sf.blocks(recording, blocksize=blocksize, dtype=dtype, always_2d=True)
+
+def delay_and_sum_blocks(blocks, sample_delays, blocksize: int, channel_order: list = None,
+                         fractional_order: int = None, dtype=np.float64):
+    """
+    Applies DSB algorithm to a multichannel signal given block by block. Output equals delay_and_sum of the whole
+    signal, including the samples after the end of the input which are needed for the highest delay.
+    :param blocks: iterable of blocks of shape (frames, channels), all but the last block have blocksize frames
+    :param sample_delays: delays in samples, where index of an array matches microphone number
+    :param blocksize: number of frames in one block
+    :param channel_order: input channel of every microphone, None to keep channels as they are
+    :param fractional_order: order of Lagrange fractional delay filters, None for integer delays
+    :param dtype: data type of the processing and of the output blocks
+    :return: generator of mono blocks
+    """
+    processor = None
+    for block in blocks:
+        if processor is None:
+            processor = DelayAndSumProcessor(sample_delays, blocksize, block.shape[1], channel_order,
+                                             fractional_order=fractional_order, dtype=dtype)
+            padded = np.zeros((blocksize, block.shape[1]), dtype=dtype)
+        else:
+            # Output of the previous block is complete, because more input follows
+            yield processor.output.copy()
+        frames = block.shape[0]
+        if frames < blocksize:
+            padded[:frames] = block
+            padded[frames:] = 0
+            block = padded
+        processor.process(block)
+    if processor is None:
+        return
+    # Output of the last block is followed by the samples needed for the highest delay
+    remaining = frames + int(processor.sample_delays.max()) + processor.taps.shape[-1] - 1
+    padded.fill(0)
+    while True:
+        yield processor.output[:remaining].copy()
+        remaining -= blocksize
+        if remaining <= 0:
+            break
+        processor.process(padded)
+
+def dft_bins(blocks, frames: int, bins) -> np.ndarray:
+    """
+    Calculates chosen bins of the DFT of a whole multichannel signal given block by block, the result equals
+    np.fft.fft(signal, axis=0)[bins].
+    :param blocks: iterable of blocks of shape (frames, channels)
+    :param frames: number of frames of the whole signal
+    :param bins: indices of the DFT bins
+    :return: complex array of shape (bins, channels)
+    """
+    bins = np.atleast_1d(np.asarray(bins, dtype=np.int64))
+    result = None
+    start = 0
+    for block in blocks:
+        n = np.arange(start, start + block.shape[0], dtype=np.int64)
+        # Phase is reduced modulo the DFT length in integers, so it stays accurate also for long signals
+        kernel = np.exp(-2j * np.pi * ((bins[:, np.newaxis] * n) % frames) / frames)
+        block_bins = kernel @ block
+        result = block_bins if result is None else result + block_bins
+        start += block.shape[0]
+    return result
+
+def process_recording(recording: str, output: str, sample_delays, mic_order: list = None,
+                      fractional_order: int = None, blocksize: int = DEFAULT_BLOCKSIZE, dtype=np.float64) -> str:
+    """
+    Applies DSB algorithm to one recording and saves the mono result. Recording is read and processed block by block.
+    Length of the output is given by the length of the recording and the highest delay.
+    :param recording: path to the multichannel recording
+    :param output: path of the processed file
+    :param sample_delays: delays in samples, where index of an array matches microphone number
+    :param mic_order: input channel of every microphone, None to keep channels as they are
+    :param fractional_order: order of Lagrange fractional delay filters, None for integer delays
+    :param blocksize: number of frames processed at once
+    :param dtype: data type of the processing, float64 or float32
+    :return: path of the processed file
+    """
+    import soundfile as sf
+    info = sf.info(recording)
+    # Rearrange microphones in correct order
+    if mic_order is not None and info.channels != len(mic_order):
+        mic_order = None
+    blocks = delay_and_sum_blocks(read_blocks(recording, blocksize), sample_delays, blocksize, mic_order,
+                                  fractional_order, dtype)
+    with sf.SoundFile(output, 'w', info.samplerate, 1) as output_file:
+        for block in blocks:
+            output_file.write(block)
+    return output
+
+def process_measurement_directory(directory: str, output_directory: str, sample_delays, mic_order: list = None,
+                                  fractional_order: int = None, workers: int = None, force: bool = False,
+                                  pattern: str = "krok_*.wav", dtype=np.float64) -> list:
+    """
+    Applies DSB algorithm to all recordings of a measurement directory using a pool of worker processes. Recordings
+    whose processed file is newer than the recording and was processed with the same parameters are skipped unless
+    force is set.
+    :param directory: measurement directory
+    :param output_directory: directory of processed files, created if it does not exist
+    :param sample_delays: delays in samples, where index of an array matches microphone number
+    :param mic_order: input channel of every microphone, None to keep channels as they are
+    :param fractional_order: order of Lagrange fractional delay filters, None for integer delays
+    :param workers: number of worker processes, number of CPUs by default
+    :param force: process also recordings which are up to date
+    :param pattern: glob pattern of the recordings
+    :param dtype: data type of the processing, float64 or float32
+    :return: list of paths of files processed by this call
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    key = parameters_key(sample_delays, mic_order, fractional_order, dtype)
+    parameters = load_parameters(output_directory)
+    jobs = [(recording, processed_path(recording, output_directory))
+            for recording in find_recordings(directory, pattern)]
+    jobs = [(recording, output) for recording, output in jobs
+            if force or not is_up_to_date(recording, output, key, parameters)]
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_recording, recording, output, sample_delays, mic_order, fractional_order,
+                                   DEFAULT_BLOCKSIZE, dtype)
+                   for recording, output in jobs]
+        processed = []
+        for future in futures:
+            processed.append(future.result())
+            # Recorded after every file, so an interrupted run keeps the files finished so far
+            parameters[os.path.basename(processed[-1])] = key
+            save_parameters(output_directory, parameters)
+            print(f"File {os.path.basename(processed[-1])} processed!")
+    return processed
@@ -0,0 +1,143 @@
+"""
+Recorder which streams audio blocks to WAV/FLAC files on disk from a background thread. The audio callback only copies
+a block into one of preallocated slots and hands it over through a bounded queue, so recording does not grow any
+array in memory and writing to disk never blocks the callback.
+"""
+import os
+import queue
+import threading
+import numpy as np
+
+
+class StreamRecorder:
+    """
+    Incremental recorder of a multichannel stream. Blocks which cannot be handed over because all slots are waiting
+    for the writer thread are dropped and counted in dropped_blocks. With max_file_duration set the recording is split
+    into numbered files (name_000.wav, name_001.wav, ...) and with max_files set only the newest files are kept.
+
+    The first file is opened by start, so a wrong path is reported to the caller. When writing fails later, e.g. on a
+    full disk, the error is kept in the error attribute, following blocks are dropped and stop raises the error.
+    """
+    def __init__(self, path: str, samplerate: int, channels: int, blocksize: int, queue_blocks: int = 64,
+                 max_file_duration: float = None, max_files: int = None, subtype: str = None,
+                 lossless: bool = False, dtype=np.float64):
+        """
+        :param path: output file, format is given by the extension (.wav or .flac)
+        :param samplerate: sampling frequency of the recorded stream in Hz
+        :param channels: number of recorded channels
+        :param blocksize: maximal number of frames in one block
+        :param queue_blocks: number of blocks which can wait for the writer thread
+        :param max_file_duration: maximal duration of one file in seconds, None for a single file
+        :param max_files: maximal number of kept files in rotating mode, None to keep all files
+        :param subtype: soundfile subtype of the output files, e.g. 'PCM_24' or 'FLOAT'
+        :param lossless: write waits for a free slot instead of dropping the block, for producers which are not
+                         real-time, e.g. replay of a file as fast as possible
+        :param dtype: data type of the slots, float32 halves the memory of the queue
+        """
+        self.path = path
+        self.samplerate = samplerate
+        self.channels = channels
+        self.subtype = subtype
+        self.max_files = max_files
+        self.lossless = lossless
+        self.frames_per_file = None if max_file_duration is None else int(max_file_duration * samplerate)
+        self.dropped_blocks = 0
+        self.written_frames = 0
+        self.files = []
+        self.error = None
+
+        self._slots = np.zeros((queue_blocks, blocksize, channels), dtype=dtype)
+        self._free_slots = queue.SimpleQueue()
+        for slot in range(queue_blocks):
+            self._free_slots.put(slot)
+        self._filled_slots = queue.SimpleQueue()
+        self._file = None
+        self._frames_in_file = 0
+        self._thread = None
+
+    def start(self):
+        """ Opens the first output file and starts the writer thread """
+        if self._file is None:
+            self._open_next_file()
+        self._thread = threading.Thread(target=self._writer, name="StreamRecorder", daemon=True)
+        self._thread.start()
+
+    def write(self, block: np.ndarray) -> bool:
+        """
+        Hands one block over to the writer thread. This method is meant to be called from the audio callback, it does
+        not block (unless the recorder is lossless) and does not allocate arrays.
+        :param block: block of shape (frames, channels) or (frames,) for a single channel
+        :return: True if the block has been queued, False if it has been dropped
+        """
+        if self.error is not None:
+            self.dropped_blocks += 1
+            return False
+        try:
+            slot = self._free_slots.get(block=self.lossless)
+        except queue.Empty:
+            self.dropped_blocks += 1
+            return False
+        frames = block.shape[0]
+        self._slots[slot, :frames] = block.reshape(frames, -1)
+        self._filled_slots.put((slot, frames))
+        return True
+
+    def stop(self):
+        """ Writes all queued blocks, closes the output file and stops the writer thread, raises error of writing """
+        if self._thread is not None:
+            self._filled_slots.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _writer(self):
+        while True:
+            item = self._filled_slots.get()
+            if item is None:
+                break
+            slot, frames = item
+            if self.error is None:
+                try:
+                    self._write_frames(self._slots[slot, :frames])
+                except Exception as error:
+                    # Slots are still returned, so a lossless write waiting for a free slot never blocks forever
+                    self.error = error
+            self._free_slots.put(slot)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_frames(self, data: np.ndarray):
+        while data.shape[0] > 0:
+            if self._file is None:
+                self._open_next_file()
+            frames = data.shape[0]
+            if self.frames_per_file is not None:
+                frames = min(frames, self.frames_per_file - self._frames_in_file)
+            self._file.write(data[:frames])
+            self._frames_in_file += frames
+            self.written_frames += frames
+            data = data[frames:]
+            if self.frames_per_file is not None and self._frames_in_file >= self.frames_per_file:
+                self._file.close()
+                self._file = None
+
+    def _open_next_file(self):
+        import soundfile as sf
+        path = self.path
+        if self.frames_per_file is not None:
+            name, extension = os.path.splitext(self.path)
+            path = f"{name}_{len(self.files):03d}{extension}"
+        self._file = sf.SoundFile(path, 'w', self.samplerate, self.channels, self.subtype)
+        self._frames_in_file = 0
+        self.files.append(path)
+        if self.max_files is not None and len(self.files) > self.max_files:
+            os.remove(self.files[-self.max_files - 1])
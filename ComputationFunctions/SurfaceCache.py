@@ -0,0 +1,247 @@
+"""
+Persistent cache of expensive results, e.g. frequency x angle surfaces of beam patterns or measured directivity
+matrices. Every result is stored in one file named by a hash of all inputs it was calculated from. Single arrays are
+stored as .npy and loaded memory-mapped, tuples of arrays are stored as .npz. Total size of the cache directory is
+limited and least recently used files are evicted first, the time of the last use is kept in the file mtime.
+Surfaces can also be calculated row by row into the cache file, so an interrupted calculation is resumed later.
+"""
+import os
+import numbers
+import hashlib
+import tempfile
+import numpy as np
+from ComputationFunctions import ComputationFunctions as cf
+
+# Cache directory used when no directory is given, can be changed by BEAMFORMING_CACHE environment variable
+DEFAULT_DIRECTORY = os.environ.get(
+    "BEAMFORMING_CACHE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".surface_cache"))
+# Increase when the stored format or the meaning of the inputs changes, all older entries are then ignored
+CACHE_VERSION = 1
+
+
+def _update_hash(digest, value):
+    """
+    Feeds canonical representation of a value into the hash, arrays are hashed with their dtype and shape. Numbers are
+    hashed by their value, so 90, 90.0 and np.float64(90) (and arrays of them) give the same key.
+    """
+    if isinstance(value, cf.ArrayGeometry):
+        value = value.positions
+    if isinstance(value, numbers.Number) and not isinstance(value, (bool, np.bool_)):
+        value = np.asarray(value)
+    if isinstance(value, dict):
+        for name in sorted(value):
+            digest.update(f"{name}=".encode())
+            _update_hash(digest, value[name])
+    elif isinstance(value, (list, tuple, np.ndarray)) and not isinstance(value, str):
+        array = np.ascontiguousarray(value)
+        if array.dtype == object:
+            digest.update(f"sequence{len(value)}:".encode())
+            for item in value:
+                _update_hash(digest, item)
+        else:
+            if array.dtype.kind in "iuf":
+                array = array.astype(np.float64)
+            elif array.dtype.kind == "c":
+                array = array.astype(np.complex128)
+            digest.update(f"array{array.dtype.str}{array.shape}:".encode())
+            digest.update(array.tobytes())
+    else:
+        digest.update(f"{type(value).__name__}:{value!r};".encode())
+
+def cache_key(**inputs) -> str:
+    """
+    Calculates key of a result from all inputs it depends on. Arrays are compared by their values, geometries by
+    positions of the microphones.
+    :param inputs: named inputs, e.g. geometry, theta, phi, c, frequencies, resolution and sf
+    :return: hexadecimal hash
+    """
+    digest = hashlib.sha256(f"version{CACHE_VERSION};".encode())
+    _update_hash(digest, inputs)
+    return digest.hexdigest()
+
+def file_stamps(paths: list) -> list:
+    """ Returns path, size and modification time of every file, used as an input of results calculated from files """
+    return [f"{path}:{os.path.getsize(path)}:{os.stat(path).st_mtime_ns}" for path in paths]
+
+
+class SurfaceCache:
+    """
+    On-disk cache of numpy results with size limit and least recently used eviction. Results are returned read-only,
+    single arrays as memory-mapped files, so a hit costs only opening a file.
+    """
+    def __init__(self, directory: str = None, max_bytes: int = 2 * 1024 ** 3):
+        """
+        :param directory: directory the results are stored in, DEFAULT_DIRECTORY by default
+        :param max_bytes: maximal total size of the stored results in bytes
+        """
+        self.directory = DEFAULT_DIRECTORY if directory is None else directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, compute, **inputs):
+        """
+        Returns stored result for given inputs, calculating and storing it by calling compute() if it is not present.
+        :param compute: function without arguments returning an array or a tuple of arrays
+        :param inputs: all inputs the result depends on, see cache_key
+        :return: read-only array (memory-mapped) or tuple of arrays
+        """
+        key = cache_key(**inputs)
+        for extension in (".npy", ".npz"):
+            path = os.path.join(self.directory, key + extension)
+            if os.path.exists(path + ".progress"):
+                continue
+            try:
+                value = self._load(path)
+            except FileNotFoundError:
+                continue
+            self.hits += 1
+            os.utime(path)
+            return value
+
+        self.misses += 1
+        value = compute()
+        path = self._store(key, value)
+        self.evict(keep=path)
+        return self._load(path)
+
+    def response(self, geometry: cf.ArrayGeometry, theta: float, steering_phi, look_phi, frequencies, c: int,
+                 sf: int = None, decibels: bool = False, dtype=np.float64) -> np.ndarray:
+        """
+        Cached version of ComputationFunctions.array_response, see its parameters.
+        :param decibels: store magnitude of the response in decibels instead of the complex response
+        :return: read-only array of shape (frequencies, steering angles, look angles)
+        """
+        def compute():
+            response = cf.array_response(geometry, theta, steering_phi, look_phi, frequencies, c, sf, dtype=dtype)
+            return cf.signal_to_decibels(response) if decibels else response
+
+        return self.get(compute, function="array_response", geometry=geometry, theta=theta, steering_phi=steering_phi,
+                        look_phi=look_phi, frequencies=frequencies, c=c, sf=sf, decibels=decibels,
+                        dtype=np.dtype(dtype).str)
+
+    def response_rows(self, geometry: cf.ArrayGeometry, theta: float, steering_phi, look_phi, frequencies, c: int,
+                      sf: int = None, decibels: bool = False, progressive: bool = False, levels: int = 4,
+                      rows: int = 32, dtype=np.float64):
+        """
+        Progressive version of response. Rows from ComputationFunctions.array_response_rows are written to the
+        memory-mapped cache file right away and calculated rows are recorded in a .progress file next to it. After an
+        interruption the surface is resumed and only missing rows are calculated. Finished surface is the same entry
+        as the one of response.
+        :return: generator of (indices of new rows, surface, mask of calculated rows), only rows set in the mask of
+                 the (frequencies, steering angles, look angles) surface are valid
+        """
+        path = os.path.join(self.directory, cache_key(
+            function="array_response", geometry=geometry, theta=theta, steering_phi=steering_phi, look_phi=look_phi,
+            frequencies=frequencies, c=c, sf=sf, decibels=decibels, dtype=np.dtype(dtype).str) + ".npy")
+        progress_path = path + ".progress"
+        frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+        surface = None
+        if os.path.exists(progress_path):
+            calculated = np.load(progress_path)
+            if not os.path.exists(path):
+                # Partial surface has been removed, the calculation starts again
+                os.remove(progress_path)
+            elif calculated.all():
+                # Consumer stopped after the last rows, only the .progress file was not removed
+                os.remove(progress_path)
+            else:
+                surface = np.load(path, mmap_mode='r+')
+        if surface is None and os.path.exists(path):
+            self.hits += 1
+            os.utime(path)
+            yield np.arange(frequencies.size), np.load(path, mmap_mode='r'), np.ones(frequencies.size, dtype=bool)
+            return
+
+        self.misses += 1
+        if surface is None:
+            shape = (frequencies.size, np.size(steering_phi), np.size(look_phi))
+            surface = np.lib.format.open_memmap(path, mode='w+',
+                                                 dtype=dtype if decibels else cf.complex_dtype(dtype), shape=shape)
+            calculated = np.zeros(frequencies.size, dtype=bool)
+            self._save_progress(progress_path, calculated)
+
+        remaining = np.flatnonzero(~calculated)
+        for indices, response in cf.array_response_rows(geometry, theta, steering_phi, look_phi,
+                                                        frequencies[remaining], c, sf, progressive, levels, rows,
+                                                        dtype=dtype):
+            indices = remaining[indices]
+            surface[indices] = cf.signal_to_decibels(response) if decibels else response
+            surface.flush()
+            calculated[indices] = True
+            self._save_progress(progress_path, calculated)
+            yield indices, surface, calculated
+        os.remove(progress_path)
+        self.evict(keep=path)
+
+    def _save_progress(self, progress_path: str, calculated: np.ndarray):
+        descriptor, temporary = tempfile.mkstemp(suffix=".progress", dir=self.directory)
+        with os.fdopen(descriptor, "wb") as output_file:
+            np.save(output_file, calculated)
+        os.replace(temporary, progress_path)
+
+    def _load(self, path: str):
+        if path.endswith(".npy"):
+            return np.load(path, mmap_mode='r')
+        with np.load(path) as archive:
+            arrays = [archive[f"arr_{i}"] for i in range(len(archive.files))]
+        for array in arrays:
+            array.setflags(write=False)
+        return tuple(arrays)
+
+    def _store(self, key: str, value) -> str:
+        """ Writes the result to a temporary file first, so other processes never load incomplete files """
+        extension = ".npz" if isinstance(value, tuple) else ".npy"
+        path = os.path.join(self.directory, key + extension)
+        descriptor, temporary = tempfile.mkstemp(suffix=extension, dir=self.directory)
+        with os.fdopen(descriptor, "wb") as output_file:
+            if isinstance(value, tuple):
+                np.savez(output_file, *value)
+            else:
+                np.save(output_file, np.asarray(value))
+        os.replace(temporary, path)
+        if os.path.exists(path + ".progress"):
+            os.remove(path + ".progress")
+        return path
+
+    def entries(self) -> list:
+        """ Returns list of (last use, size, path) of all stored results, least recently used first """
+        result = []
+        for name in os.listdir(self.directory):
+            if name.endswith((".npy", ".npz")):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                result.append((stat.st_mtime, stat.st_size, path))
+        return sorted(result)
+
+    def evict(self, keep: str = None):
+        """
+        Removes least recently used results until the total size fits into max_bytes. Surfaces which are being
+        calculated by response_rows (they have a .progress file) are never removed.
+        :param keep: path of a result which is never removed, e.g. the one just stored
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path != keep and not os.path.exists(path + ".progress"):
+                os.remove(path)
+                total -= size
+
+    def info(self) -> dict:
+        """ Returns hit and miss counters together with the maximal and current size of the cache in bytes """
+        entries = self.entries()
+        return {"hits": self.hits, "misses": self.misses, "max_bytes": self.max_bytes,
+                "currbytes": sum(size for _, size, _ in entries), "entries": len(entries)}
+
+    def clear(self):
+        """ Removes all stored and partially calculated results and resets counters """
+        for _, _, path in self.entries():
+            os.remove(path)
+            if os.path.exists(path + ".progress"):
+                os.remove(path + ".progress")
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,36 @@
+"""
+Signal processing of microphone arrays: delays, beam patterns and responses (ComputationFunctions), block processors
+of the real-time pipeline (DelayAndSum, FrequencyDomain, DirectionOfArrival), recording and audio backends
+(StreamRecorder, AudioBackends, Instrumentation) and offline processing of measurements (MeasurementProcessing,
+MeasurementAnalysis, SurfaceCache).
+
+Importing the package does not import any submodule, they are imported on first access, e.g.
+    import ComputationFunctions
+    ComputationFunctions.DelayAndSum.DelayAndSumProcessor
+Optional dependencies (sounddevice, soundfile, scipy) are imported only by the functions which need them and no module
+imports matplotlib, so worker processes and tests can import the DSP code without audio devices or plotting backends.
+"""
+import importlib
+
+__all__ = [
+    "AudioBackends",
+    "ComputationFunctions",
+    "DelayAndSum",
+    "DirectionOfArrival",
+    "FrequencyDomain",
+    "Instrumentation",
+    "MeasurementAnalysis",
+    "MeasurementProcessing",
+    "StreamRecorder",
+    "SurfaceCache",
+]
+
+
+def __getattr__(name: str):
+    """ Imports a submodule on first access of the attribute of the same name """
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(__all__))